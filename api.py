@@ -1,12 +1,78 @@
-from fastapi import FastAPI, HTTPException
+import math
+import os
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import Dict
+from pydantic import BaseModel, Field, ValidationError
+from typing import Annotated, Any, Dict, List, Literal, Optional, Tuple, Union
+
+import numpy as np
+
+from starlette.concurrency import run_in_threadpool
 
-from formulas import list_formulas_for_api, calculate_by_id, PREFIXES
+from formulas import (
+    REGISTRY,
+    PREFIXES_JSON,
+    SWEEP_CHUNK,
+    SweepGrid,
+    SweepRange,
+    calculate_by_id,
+    calculate_batch,
+    format_many,
+    cache_stats,
+    calculate_batch_chunks,
+    derive,
+    partial_units,
+    link_budget_chunks,
+    monte_carlo,
+    solve,
+)
+from coalescencia import MicroBatcher, SingleFlight
+from metricas import METRICS, MetricsMiddleware, add_phase, instrumented, phase, record_error, run_tagged
+from memoria import TRACER, MemoryMiddleware, note_items
+from perfilado import PROFILER, ProfilerMiddleware
+from trabajos import ColumnStore, Job, JobManager, QueueFullError
+from respuestas import (
+    STREAM_MEDIA_TYPES,
+    binary_columns,
+    binary_stream,
+    columns_to_json,
+    encode_columns,
+    json_bytes,
+    json_mask,
+    ndjson_stream,
+    negotiate,
+)
 
 app = FastAPI(title="API Calculadora de Telecomunicaciones", version="1.0.0")
 
+# Micro-lotes de /calculate (desactivados con ventana 0)
+MICROBATCH_WINDOW_MS = float(os.environ.get("CALC_MICROBATCH_WINDOW_MS", "0"))
+MICROBATCH_MAX = int(os.environ.get("CALC_MICROBATCH_MAX", "256"))
+
+_MICROBATCHER = MicroBatcher(MICROBATCH_WINDOW_MS / 1000, MICROBATCH_MAX) if MICROBATCH_WINDOW_MS > 0 else None
+
+# Peticiones idénticas simultáneas a /calculate comparten cálculo y respuesta ("0" lo desactiva)
+SINGLE_FLIGHT = os.environ.get("CALC_SINGLE_FLIGHT", "1") != "0"
+
+_SINGLE_FLIGHT = SingleFlight() if SINGLE_FLIGHT else None
+
+# Trabajos en segundo plano: concurrencia, profundidad de cola y procesos de cálculo
+JOBS_MAX_CONCURRENT = int(os.environ.get("JOBS_MAX_CONCURRENT", "2"))
+JOBS_MAX_QUEUED = int(os.environ.get("JOBS_MAX_QUEUED", "16"))
+JOBS_PROCESSES = int(os.environ.get("JOBS_PROCESSES", "0")) or None
+
+JOBS = JobManager(JOBS_MAX_CONCURRENT, JOBS_MAX_QUEUED, JOBS_PROCESSES)
+
+# Endpoints /debug (perfilado y memoria) solo con CALC_DEBUG=1
+DEBUG_ENDPOINTS = os.environ.get("CALC_DEBUG", "0") == "1"
+
+# Perfilador y medición de memoria van dentro del middleware de métricas para conocer la fórmula
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(MemoryMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -18,7 +84,199 @@ app.add_middleware(
 
 class CalculatePayload(BaseModel):
     formula_id: str = Field(..., description="Identificador estable de la fórmula")
-    values: Dict[str, float] = Field(..., description="Valores numéricos en unidades base SI")
+    values: Dict[str, Union[float, List[float]]] = Field(
+        ..., description="Valores numéricos en unidades base SI (listas para campos por etapa)"
+    )
+    display: bool = Field(True, description="Incluir la cadena formateada 'display'")
+
+
+class BatchPayload(BaseModel):
+    formula_id: str = Field(..., description="Identificador estable de la fórmula")
+    values: Dict[str, Union[float, List[float], List[List[float]]]] = Field(
+        ...,
+        description="Columnas de valores en unidades base SI (un escalar se repite en todas las filas; "
+        "los campos por etapa son matrices filas × etapas)",
+    )
+    formats: List[Literal["normal", "prefixed", "scientific", "display"]] = Field(
+        default_factory=list, description="Representaciones de texto a incluir (ninguna por defecto)"
+    )
+    jacobian: bool = Field(False, description="Incluir las derivadas parciales respecto a cada campo")
+
+
+class RangeSpec(BaseModel):
+    start: float
+    stop: float
+    num: int = Field(..., gt=0, description="Número de puntos del eje")
+    scale: Literal["linear", "log"] = "linear"
+
+
+class SweepPayload(BaseModel):
+    formula_id: str = Field(..., description="Identificador estable de la fórmula")
+    ranges: Dict[str, RangeSpec] = Field(..., description="Ejes a barrer por campo")
+    fixed: Dict[str, float] = Field(default_factory=dict, description="Valores fijos del resto de campos")
+
+
+class StageSpec(BaseModel):
+    name: Optional[str] = None
+    gain: float = Field(..., gt=0, description="Ganancia lineal de la etapa")
+    noise_factor: float = Field(..., ge=1, description="Factor de ruido lineal de la etapa")
+
+
+class OptimizePayload(BaseModel):
+    stages: List[StageSpec] = Field(..., min_length=1, description="Etapas disponibles")
+    min_gain: float = Field(1.0, gt=0, description="Ganancia total mínima (lineal)")
+    max_stages: Optional[int] = Field(None, gt=0, description="Número máximo de etapas en la cadena")
+    time_budget: Optional[float] = Field(None, gt=0, description="Tiempo máximo de búsqueda en segundos")
+    workers: Optional[int] = Field(
+        None, gt=0, description="Procesos de búsqueda (como mucho, los del pool de trabajos)"
+    )
+
+
+class LinkBudgetPayload(BaseModel):
+    distances: Union[List[float], RangeSpec] = Field(..., description="Distancias (m)")
+    frequencies: Union[List[float], RangeSpec] = Field(..., description="Frecuencias (Hz)")
+    bandwidths: Union[List[float], RangeSpec] = Field(..., description="Anchos de banda (Hz)")
+    Pt: float = Field(1.0, description="Potencia transmitida (W)")
+    Gt: float = Field(0.0, description="Ganancia de antena TX (dBi)")
+    Gr: float = Field(0.0, description="Ganancia de antena RX (dBi)")
+    L: float = Field(0.0, description="Pérdidas de cable (dB)")
+    T: float = Field(290.0, description="Temperatura de ruido (K)")
+    NF: float = Field(0.0, description="Índice de ruido del receptor (dB)")
+
+
+class DerivePayload(BaseModel):
+    values: Dict[str, Union[float, List[float]]] = Field(
+        ..., description="Magnitudes conocidas en unidades base SI (listas para modo lote)"
+    )
+    display: bool = Field(False, description="Incluir la cadena formateada 'display' de cada magnitud")
+
+
+class SolvePayload(BaseModel):
+    formula_id: str = Field(..., description="Identificador estable de la fórmula")
+    unknown: str = Field(..., description="Campo a despejar")
+    target: Union[float, List[float]] = Field(..., description="Resultado deseado (lista para varias filas)")
+    values: Dict[str, Union[float, List[float]]] = Field(
+        ..., description="Resto de campos en unidades base SI (un escalar se repite en todas las filas)"
+    )
+    bracket: Optional[Tuple[float, float]] = Field(
+        None, description="Intervalo de búsqueda si la fórmula no tiene despeje analítico para el campo"
+    )
+    formats: List[Literal["normal", "prefixed", "scientific", "display"]] = Field(
+        default_factory=list, description="Representaciones de texto a incluir (ninguna por defecto)"
+    )
+
+
+class DistributionSpec(BaseModel):
+    dist: Literal["normal", "uniform", "empirical"]
+    mean: Optional[float] = Field(None, description="Media (normal)")
+    std: Optional[float] = Field(None, ge=0, description="Desviación típica (normal)")
+    low: Optional[float] = Field(None, description="Límite inferior (uniforme)")
+    high: Optional[float] = Field(None, description="Límite superior (uniforme)")
+    samples: Optional[List[float]] = Field(None, description="Muestras observadas (empírica)")
+
+
+class MonteCarloPayload(BaseModel):
+    formula_id: str = Field(..., description="Identificador estable de la fórmula")
+    distributions: Dict[str, Union[float, DistributionSpec]] = Field(
+        ..., description="Valor fijo o distribución de cada campo en unidades base SI"
+    )
+    samples: int = Field(100_000, gt=0, description="Número de muestras")
+    percentiles: List[Annotated[float, Field(ge=0, le=100)]] = Field(
+        [5, 50, 95], description="Percentiles a estimar (0-100)"
+    )
+    bins: Optional[int] = Field(None, gt=0, le=10_000, description="Clases del histograma (omitido si no se indica)")
+    seed: Optional[int] = Field(None, ge=0, description="Semilla para reproducir el resultado")
+
+
+class JobPayload(BaseModel):
+    kind: Literal["sweep", "optimize", "montecarlo"] = Field(..., description="Tipo de trabajo")
+    params: Dict[str, Any] = Field(..., description="Parámetros del trabajo (como en /sweep, /optimize o /montecarlo)")
+
+
+class MemoryTracePayload(BaseModel):
+    frames: int = Field(10, ge=1, le=100, description="Marcos de pila guardados por asignación")
+
+
+class SnapshotPayload(BaseModel):
+    name: Optional[str] = Field(None, description="Nombre de la instantánea (correlativo si se omite)")
+
+
+class ProfilerPayload(BaseModel):
+    fraction: float = Field(1.0, gt=0, le=1, description="Fracción de peticiones a muestrear")
+    duration: Optional[float] = Field(None, gt=0, description="Segundos de muestreo (sin límite si se omite)")
+    interval_ms: float = Field(5.0, ge=0.5, le=1000, description="Intervalo entre muestras de pila en ms")
+
+
+# Límite de puntos para respuestas JSON completas
+SWEEP_MAX_POINTS = 1_000_000
+
+# Límite de muestras de /montecarlo síncrono (más allá, usar /jobs)
+MONTE_CARLO_MAX_SAMPLES = 10_000_000
+
+
+StreamMode = Optional[Literal["ndjson", "binary"]]
+
+_END = object()
+
+
+async def _stream_body(request: Request, chunks):
+    """Avanza el generador en el threadpool bloque a bloque y se detiene si el cliente se va.
+
+    Starlette espera a que cada ``send`` termine antes de pedir el siguiente bloque, así que
+    el cálculo nunca se adelanta a lo que el cliente consume.
+    """
+    try:
+        while not await request.is_disconnected():
+            chunk = await run_in_threadpool(next, chunks, _END)
+            if chunk is _END:
+                break
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def _stream_response(request: Request, mode: str, header: dict, chunks, inputs=()):
+    if mode == "ndjson":
+        body = ndjson_stream(header, chunks, inputs)
+        headers = {}
+    else:
+        first = next(chunks, None)
+        if first is None:
+            names = [*inputs, "value"]
+        else:
+            names = binary_columns(first[1])
+            chunks = _chain_first(first, chunks)
+        body = binary_stream(names, chunks, inputs)
+        headers = {"X-Columns": ",".join(names), "X-Unit": header["unit"]}
+    return StreamingResponse(
+        _stream_body(request, body), media_type=STREAM_MEDIA_TYPES[mode], headers=headers
+    )
+
+
+def _negotiated_response(request: Request, columns: dict, meta: dict, inputs=()):
+    """Respuesta Arrow, .npy o MessagePack si la pide Accept; None para seguir con JSON."""
+    media_type = negotiate(request.headers.get("accept", ""))
+    if media_type is None:
+        return None
+    try:
+        content = encode_columns(media_type, columns, meta, inputs)
+    except RuntimeError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    headers = {"X-Columns": ",".join(columns), "X-Unit": meta["unit"]}
+    if "shape" in meta:
+        headers["X-Shape"] = ",".join(map(str, meta["shape"]))
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+def _bad_request(e: Exception) -> HTTPException:
+    """Error 400 con el mensaje de la excepción; su causa queda anotada para /metrics."""
+    record_error(e)
+    return HTTPException(status_code=400, detail=str(e))
+
+
+def _chain_first(first, rest):
+    yield first
+    yield from rest
 
 
 @app.get("/health")
@@ -26,22 +284,470 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/stats")
+def stats():
+    return {
+        "cache": cache_stats(),
+        "microbatch": _MICROBATCHER.stats() if _MICROBATCHER is not None else {"enabled": False},
+        "coalescing": _SINGLE_FLIGHT.stats() if _SINGLE_FLIGHT is not None else {"enabled": False},
+        "jobs": JOBS.stats(),
+    }
+
+
 @app.get("/prefixes")
 def prefixes():
-    return PREFIXES
+    return Response(content=PREFIXES_JSON, media_type="application/json")
 
 
 @app.get("/formulas")
 def formulas():
-    return list_formulas_for_api()
+    return Response(content=REGISTRY.formulas_json(), media_type="application/json")
+
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
+async def _calculate_json(payload: CalculatePayload) -> bytes:
+    try:
+        if _MICROBATCHER is not None:
+            # El micro-lote formatea en bloque junto con el cálculo
+            with phase("compute"):
+                res = await _MICROBATCHER.submit(payload.formula_id, payload.values, payload.display)
+        else:
+            # calculate_by_id mide cálculo y formato por separado y guarda "display" en la caché
+            timings = {}
+            try:
+                res = await run_in_threadpool(
+                    run_tagged, calculate_by_id, payload.formula_id, payload.values, payload.display, timings
+                )
+            finally:
+                for name, seconds in timings.items():
+                    add_phase(name, seconds)
+    except Exception as e:
+        raise _bad_request(e)
+    with phase("format"):
+        return json_bytes(res)
 
 
 @app.post("/calculate")
-def calculate(payload: CalculatePayload):
+@instrumented
+async def calculate(payload: CalculatePayload, request: Request):
+    if _SINGLE_FLIGHT is None:
+        content = await _calculate_json(payload)
+    else:
+        key = ("/calculate", await request.body())
+        content = await _SINGLE_FLIGHT.do(key, lambda: _calculate_json(payload))
+    return Response(content=content, media_type="application/json")
+
+
+@app.post("/calculate/batch")
+@instrumented
+def calculate_batch_endpoint(payload: BatchPayload, request: Request, stream: StreamMode = None):
+    note_items(max((len(v) for v in payload.values.values() if isinstance(v, list)), default=1))
+    if stream:
+        try:
+            chunks = calculate_batch_chunks(
+                payload.formula_id, payload.values, formats=payload.formats, jacobian=payload.jacobian
+            )
+            header = {"formula_id": payload.formula_id, "unit": REGISTRY.get(payload.formula_id).unit}
+        except Exception as e:
+            raise _bad_request(e)
+        if payload.jacobian:
+            header["partial_units"] = partial_units(payload.formula_id)
+        flat = ((offset, _flatten_batch(res)) for offset, res in chunks)
+        return _stream_response(request, stream, header, flat)
     try:
-        return calculate_by_id(payload.formula_id, payload.values)
+        with phase("compute"):
+            res = calculate_batch(payload.formula_id, payload.values, jacobian=payload.jacobian)
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        raise _bad_request(e)
+    with phase("format"):
+        return _batch_response(payload, request, res)
+
+
+def _batch_response(payload: BatchPayload, request: Request, res: dict) -> Response:
+    if payload.formats:
+        parts = tuple(p for p in payload.formats if p != "display")
+        res["formats"] = format_many(res["value"], res["unit"], parts, display="display" in payload.formats)
+    valid = res["valid"]
+    meta = {
+        "formula_id": payload.formula_id,
+        "unit": res["unit"],
+        "count": int(valid.size),
+        "invalid": int(valid.size - np.count_nonzero(valid)),
+    }
+    negotiated = _negotiated_response(request, _flatten_batch(res), meta)
+    if negotiated is not None:
+        return negotiated
+    out = {
+        "unit": res["unit"],
+        "count": int(valid.size),
+        "invalid": int(valid.size - np.count_nonzero(valid)),
+        "value": np.where(valid, res["value"], None).tolist(),
+        "valid": valid.tolist(),
+    }
+    if "partials" in res:
+        out["partials"] = {k: np.where(json_mask(valid, v), v, None).tolist() for k, v in res["partials"].items()}
+        out["partial_units"] = partial_units(payload.formula_id)
+    if "formats" in res:
+        out["formats"] = {k: np.where(valid, v, None).tolist() for k, v in res["formats"].items()}
+    return Response(content=json_bytes(out), media_type="application/json")
+
+
+def _flatten_batch(res: dict) -> dict:
+    columns = {"value": res["value"], "valid": res["valid"]}
+    for name, partial in res.get("partials", {}).items():
+        if partial.ndim == 1:
+            columns[f"d_{name}"] = partial
+        else:
+            # Campos por etapa: una columna por etapa
+            columns.update({f"d_{name}_{i}": partial[:, i] for i in range(partial.shape[1])})
+    columns.update(res.get("formats", {}))
+    return columns
+
+
+@app.post("/sweep")
+@instrumented
+def sweep_endpoint(payload: SweepPayload, request: Request, stream: StreamMode = None):
+    try:
+        grid = SweepGrid(
+            payload.formula_id, {k: r.model_dump() for k, r in payload.ranges.items()}, payload.fixed
+        )
+    except Exception as e:
+        raise _bad_request(e)
+    note_items(grid.size)
+    if stream:
+        header = {
+            "formula_id": payload.formula_id,
+            "unit": grid.unit,
+            "shape": list(grid.shape),
+            "fields": list(grid.names),
+            "count": grid.size,
+        }
+        chunks = ((start, grid.chunk(start, start + SWEEP_CHUNK)) for start in range(0, grid.size, SWEEP_CHUNK))
+        return _stream_response(request, stream, header, chunks, grid.names)
+    if grid.size > SWEEP_MAX_POINTS:
+        raise HTTPException(
+            status_code=413, detail=f"El barrido tiene {grid.size} puntos (máximo {SWEEP_MAX_POINTS})"
+        )
+    with phase("compute"):
+        columns = grid.chunk(0, grid.size)
+    with phase("format"):
+        return _sweep_response(payload, request, grid, columns)
+
+
+def _sweep_response(payload: SweepPayload, request: Request, grid: SweepGrid, columns: dict) -> Response:
+    meta = {
+        "formula_id": payload.formula_id,
+        "unit": grid.unit,
+        "shape": list(grid.shape),
+        "fields": list(grid.names),
+        "count": grid.size,
+    }
+    negotiated = _negotiated_response(request, columns, meta, grid.names)
+    if negotiated is not None:
+        return negotiated
+    out = {
+        "unit": grid.unit,
+        "shape": list(grid.shape),
+        "fields": list(grid.names),
+        "count": grid.size,
+        "columns": columns_to_json(columns, grid.names),
+    }
+    return Response(content=json_bytes(out), media_type="application/json")
+
+
+def _axis(spec):
+    if isinstance(spec, RangeSpec):
+        return SweepRange.from_spec(spec.model_dump())
+    return np.asarray(spec, dtype=np.float64)
+
+
+@app.post("/link-budget")
+@instrumented
+def link_budget_endpoint(payload: LinkBudgetPayload, request: Request, stream: StreamMode = None):
+    try:
+        axes = [_axis(payload.distances), _axis(payload.frequencies), _axis(payload.bandwidths)]
+    except Exception as e:
+        raise _bad_request(e)
+    shape = [len(a) for a in axes]
+    size = math.prod(shape)
+    note_items(size)
+    params = payload.model_dump(include={"Pt", "Gt", "Gr", "L", "T", "NF"})
+    chunks = link_budget_chunks(*axes, **params)
+    header = {"unit": "bits/s", "shape": shape, "fields": ["d", "f", "B"], "count": size}
+    if stream:
+        return _stream_response(request, stream, header, chunks, ("d", "f", "B"))
+    if size > SWEEP_MAX_POINTS:
+        raise HTTPException(
+            status_code=413, detail=f"La rejilla tiene {size} puntos (máximo {SWEEP_MAX_POINTS})"
+        )
+    parts = [cols for _offset, cols in chunks]
+    columns = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]} if parts else {"valid": np.empty(0, bool)}
+    return {**header, "columns": columns_to_json(columns, ("d", "f", "B"))}
+
+
+@app.post("/derive")
+@instrumented
+def derive_endpoint(payload: DerivePayload):
+    try:
+        res = derive(payload.values, formats=("display",) if payload.display else ())
+    except Exception as e:
+        raise _bad_request(e)
+    for entry in res["quantities"].values():
+        if "valid" in entry:
+            valid = entry["valid"]
+            entry["value"] = np.where(valid, entry["value"], None).tolist()
+            entry["valid"] = valid.tolist()
+            if "formats" in entry:
+                entry["display"] = np.where(valid, entry.pop("formats")["display"], None).tolist()
+    return res
+
+
+@app.post("/solve")
+@instrumented
+def solve_endpoint(payload: SolvePayload):
+    try:
+        res = solve(
+            payload.formula_id, payload.unknown, payload.target, payload.values, payload.bracket, payload.formats
+        )
+    except Exception as e:
+        raise _bad_request(e)
+    valid = res["valid"]
+    out = {
+        "field": res["field"],
+        "unit": res["unit"],
+        "method": res["method"],
+        "count": int(valid.size),
+        "invalid": int(valid.size - np.count_nonzero(valid)),
+        "value": np.where(valid, res["value"], None).tolist(),
+        "valid": valid.tolist(),
+    }
+    if "formats" in res:
+        out["formats"] = {k: np.where(valid, v, None).tolist() for k, v in res["formats"].items()}
+    return out
+
+
+@app.post("/montecarlo")
+@instrumented
+def montecarlo_endpoint(payload: MonteCarloPayload):
+    note_items(payload.samples)
+    if payload.samples > MONTE_CARLO_MAX_SAMPLES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Máximo {MONTE_CARLO_MAX_SAMPLES} muestras; usa POST /jobs con kind=montecarlo",
+        )
+    params = payload.model_dump(exclude_none=True)
+    try:
+        return monte_carlo(**params)
+    except Exception as e:
+        raise _bad_request(e)
+
+
+# ---------- Trabajos ----------
+_JOB_MODELS = {"sweep": SweepPayload, "optimize": OptimizePayload, "montecarlo": MonteCarloPayload}
+
+
+def _job_params(kind: str, params: dict) -> dict:
+    try:
+        model = _JOB_MODELS[kind].model_validate(params)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    data = model.model_dump(exclude_none=kind == "montecarlo")
+    if kind == "optimize":
+        for i, stage in enumerate(data["stages"]):
+            if stage["name"] is None:
+                stage["name"] = f"etapa {i + 1}"
+    return data
+
+
+def _submit_job(kind: str, params: dict) -> Job:
+    try:
+        return JOBS.submit(kind, params)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        raise _bad_request(e)
+
+
+def _get_job(job_id: str) -> Job:
+    try:
+        return JOBS.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+
+@app.post("/jobs", status_code=202)
+@instrumented
+def create_job(payload: JobPayload):
+    return _submit_job(payload.kind, _job_params(payload.kind, payload.params)).summary()
+
+
+@app.get("/jobs")
+def list_jobs():
+    return JOBS.stats()
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return _get_job(job_id).summary()
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str, request: Request, stream: StreamMode = None):
+    job = _get_job(job_id)
+    result = job.result
+    if result is None:
+        raise HTTPException(status_code=409, detail=f"El trabajo no tiene resultado (estado: {job.status})")
+    if not isinstance(result, ColumnStore):
+        return result
+    header = result.meta
+    inputs = tuple(header["fields"])
+    if stream:
+        return _stream_response(request, stream, header, result.chunks(), inputs)
+    if result.size > SWEEP_MAX_POINTS:
+        raise HTTPException(
+            status_code=413, detail=f"El resultado tiene {result.size} puntos; usa ?stream=ndjson o binary"
+        )
+    _offset, columns = next(result.chunks(max(result.size, 1)), (0, {}))
+    if not columns:
+        columns = {k: np.empty(0, dtype=v.dtype) for k, v in result.columns.items()}
+    negotiated = _negotiated_response(request, columns, header, inputs)
+    if negotiated is not None:
+        return negotiated
+    return {**header, "columns": columns_to_json(columns, inputs)}
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    _get_job(job_id)
+    return JOBS.cancel(job_id).summary()
+
+
+@app.post("/optimize", status_code=202)
+@instrumented
+def optimize(payload: OptimizePayload):
+    job = _submit_job("optimize", _job_params("optimize", payload.model_dump()))
+    return {"job_id": job.id, "status": job.status}
+
+
+@app.get("/optimize/{job_id}")
+def optimize_status(job_id: str):
+    job = _get_job(job_id)
+    if job.kind != "optimize":
+        raise HTTPException(status_code=404, detail="El trabajo no es una optimización")
+    return {**job.summary(), "result": job.result}
+
+
+# ---------- Depuración ----------
+def _require_debug():
+    if not DEBUG_ENDPOINTS:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@app.post("/debug/profiler/start")
+def profiler_start(payload: ProfilerPayload):
+    _require_debug()
+    PROFILER.start(payload.fraction, payload.duration, payload.interval_ms)
+    return PROFILER.status()
+
+
+@app.post("/debug/profiler/stop")
+def profiler_stop():
+    _require_debug()
+    PROFILER.stop()
+    return PROFILER.status()
+
+
+@app.get("/debug/profiler")
+def profiler_status():
+    _require_debug()
+    return PROFILER.status()
+
+
+@app.get("/debug/profiler/collapsed")
+def profiler_collapsed(route: Optional[str] = None, formula_id: Optional[str] = None):
+    """Pilas colapsadas para flamegraph.pl o speedscope."""
+    _require_debug()
+    return PlainTextResponse(PROFILER.collapsed(route, formula_id))
+
+
+@app.get("/debug/profiler/pstats")
+def profiler_pstats(route: Optional[str] = None, formula_id: Optional[str] = None):
+    """Fichero pstats (``python -m pstats perfil.pstats``)."""
+    _require_debug()
+    return Response(
+        content=PROFILER.pstats(route, formula_id),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="perfil.pstats"'},
+    )
+
+
+MemoryGroup = Literal["lineno", "filename", "traceback"]
+
+
+@app.post("/debug/memory/start")
+def memory_start(payload: MemoryTracePayload):
+    _require_debug()
+    TRACER.start(payload.frames)
+    return TRACER.status()
+
+
+@app.post("/debug/memory/stop")
+def memory_stop():
+    _require_debug()
+    TRACER.stop()
+    return TRACER.status()
+
+
+@app.get("/debug/memory")
+def memory_status():
+    """Estado de tracemalloc, instantáneas guardadas y picos por ruta (con bytes por elemento)."""
+    _require_debug()
+    return TRACER.status()
+
+
+@app.get("/debug/memory/requests")
+def memory_requests(route: Optional[str] = None):
+    _require_debug()
+    return TRACER.requests(route)
+
+
+@app.post("/debug/memory/snapshots")
+def memory_snapshot(payload: SnapshotPayload):
+    _require_debug()
+    try:
+        return TRACER.snapshot(payload.name)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/debug/memory/top")
+def memory_top(snapshot: Optional[str] = None, limit: int = Query(20, gt=0), group_by: MemoryGroup = "lineno"):
+    """Sitios con más memoria viva en una instantánea guardada o, sin ``snapshot``, en este momento."""
+    _require_debug()
+    try:
+        return TRACER.top(snapshot, limit, group_by)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/debug/memory/diff")
+def memory_diff(
+    base: str, target: Optional[str] = None, limit: int = Query(20, gt=0), group_by: MemoryGroup = "lineno"
+):
+    """Crecimiento por sitio de asignación desde ``base`` hasta ``target`` o hasta este momento."""
+    _require_debug()
+    try:
+        return TRACER.diff(base, target, limit, group_by)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 
 # Para ejecutar: uvicorn api:app --reload
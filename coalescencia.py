@@ -0,0 +1,108 @@
+"""Agrupación de peticiones concurrentes a /calculate para evaluarlas en bloque."""
+
+import asyncio
+
+from starlette.concurrency import run_in_threadpool
+
+from formulas import calculate_many
+
+
+class MicroBatcher:
+    """Reúne durante ``window`` segundos las peticiones de una misma fórmula y las evalúa juntas.
+
+    Un lote se envía al cumplirse la ventana o al llegar a ``max_batch`` peticiones. Cada
+    petición recibe el mismo resultado (o excepción) que daría calculate_by_id por separado.
+    """
+
+    def __init__(self, window: float, max_batch: int = 256):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}
+        self._timers = {}
+        self.batches = 0
+        self.requests = 0
+        self.largest = 0
+
+    async def submit(self, formula_id: str, values: dict, display: bool = True) -> dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (formula_id, display)
+        queue = self._pending.setdefault(key, [])
+        queue.append((values, future))
+        if len(queue) >= self.max_batch:
+            self._flush(key)
+        elif len(queue) == 1:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return await future
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        items = self._pending.pop(key, None)
+        if items:
+            self.batches += 1
+            self.requests += len(items)
+            self.largest = max(self.largest, len(items))
+            asyncio.ensure_future(self._run(key, items))
+
+    async def _run(self, key, items):
+        formula_id, display = key
+        try:
+            results = await run_in_threadpool(calculate_many, formula_id, [v for v, _ in items], display)
+        except Exception as e:
+            results = [e] * len(items)
+        for (_values, future), res in zip(items, results):
+            if future.done():
+                continue
+            if isinstance(res, BaseException):
+                future.set_exception(res)
+            else:
+                future.set_result(res)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "requests": self.requests,
+            "largest": self.largest,
+        }
+
+
+class SingleFlight:
+    """Comparte una única ejecución entre peticiones idénticas que están en curso a la vez.
+
+    La primera petición con una clave lanza el cálculo como tarea independiente; las demás
+    esperan esa misma tarea. Si una petición se cancela, el cálculo sigue para el resto.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.leaders = 0
+        self.collapsed = 0
+
+    async def do(self, key, compute):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+            self.leaders += 1
+        else:
+            self.collapsed += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # marca la excepción como recuperada aunque nadie espere ya
+
+    def stats(self) -> dict:
+        return {
+            "enabled": True,
+            "leaders": self.leaders,
+            "collapsed": self.collapsed,
+            "in_flight": len(self._inflight),
+        }
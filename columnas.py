@@ -0,0 +1,105 @@
+"""Datos tabulares en columnas: filas CSV a float64 y ficheros .npy/.npz mapeados en memoria."""
+
+import os
+import zipfile
+
+import numpy as np
+
+from formulas import BATCH_CHUNK, REGISTRY, as_columns, evaluate_columns
+
+
+def parse_csv(names, lines) -> dict:
+    """Columnas float64 a partir de filas CSV sin cabecera; los campos vacíos o no numéricos son NaN."""
+    rows = [line.strip() for line in lines]
+    separators = len(names) - 1
+    try:
+        # Cada fila debe tener exactamente los campos de la cabecera: si no, sobrantes y
+        # faltantes de filas distintas podrían compensarse y desalinear las columnas
+        if any(row.count(",") != separators for row in rows):
+            raise ValueError
+        table = np.array(",".join(rows).split(","), dtype=np.float64).reshape(len(rows), len(names))
+    except ValueError:
+        # Camino lento solo si el lote tiene filas mal formadas o campos vacíos; una fila con
+        # un número de campos distinto de la cabecera queda entera a NaN
+        table = np.full((len(rows), len(names)), np.nan)
+        for i, row in enumerate(rows):
+            items = row.split(",")
+            if len(items) != len(names):
+                continue
+            for j, item in enumerate(items):
+                try:
+                    table[i, j] = float(item)
+                except ValueError:
+                    pass
+    return {name: table[:, j] for j, name in enumerate(names)}
+
+
+# ---------- Ficheros .npy/.npz mapeados en memoria ----------
+def _npz_member(path: str, info: zipfile.ZipInfo) -> np.memmap:
+    """Mapea en memoria un miembro sin comprimir de un .npz a partir de su desplazamiento en el zip."""
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError(f"'{info.filename}' está comprimido; guarda el .npz con np.savez para poder mapearlo")
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        local = f.read(30)
+        # Cabecera local: nombre y campo extra preceden a los datos
+        name_len, extra_len = int.from_bytes(local[26:28], "little"), int.from_bytes(local[28:30], "little")
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran, dtype = read_header(f)
+        offset = f.tell()
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape, order="F" if fortran else "C")
+
+
+def open_columns(source) -> dict:
+    """Columnas mapeadas en memoria (solo lectura) sin cargar los datos.
+
+    ``source`` es un .npz (un campo por miembro, sin comprimir), un .npy (el campo es el nombre
+    del fichero) o un dict {campo: ruta .npy o arreglo}.
+    """
+    if isinstance(source, dict):
+        return {
+            name: np.load(value, mmap_mode="r") if isinstance(value, (str, os.PathLike)) else value
+            for name, value in source.items()
+        }
+    source = os.fspath(source)
+    if source.endswith(".npz"):
+        with zipfile.ZipFile(source) as zf:
+            members = [info for info in zf.infolist() if info.filename.endswith(".npy")]
+        return {info.filename[:-4]: _npz_member(source, info) for info in members}
+    name = os.path.splitext(os.path.basename(source))[0]
+    return {name: np.load(source, mmap_mode="r")}
+
+
+def calculate_batch_into(formula_id: str, values: dict, out, valid=None, chunk_size: int = BATCH_CHUNK) -> dict:
+    """Evalúa por bloques escribiendo cada resultado directamente en ``out`` (arreglo o ruta .npy).
+
+    Pensado para columnas mapeadas en memoria (ver open_columns): cada bloque se lee de los
+    ficheros, se evalúa y se escribe en su rebanada de ``out`` sin materializar las columnas
+    completas. Las filas inválidas quedan a NaN; ``valid`` (arreglo o ruta .npy) recibe además
+    la máscara de validez.
+    """
+    record = REGISTRY.get(formula_id)
+    cols = as_columns(record.fields, values, record.vector, cast=False)
+    n = len(next(iter(cols.values()))) if cols else 0
+    if isinstance(out, (str, os.PathLike)):
+        out = np.lib.format.open_memmap(out, mode="w+", dtype=np.float64, shape=(n,))
+    if isinstance(valid, (str, os.PathLike)):
+        valid = np.lib.format.open_memmap(valid, mode="w+", dtype=np.bool_, shape=(n,))
+    if len(out) != n or (valid is not None and len(valid) != n):
+        raise ValueError("La salida debe tener tantas filas como las columnas de entrada")
+    invalid, unit = 0, record.unit
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        block = {k: np.asarray(v[start:stop], dtype=np.float64) for k, v in cols.items()}
+        result, unit, ok = evaluate_columns(record, block)
+        np.copyto(out[start:stop], result)
+        out[start:stop][~ok] = np.nan
+        if valid is not None:
+            valid[start:stop] = ok
+        invalid += int(stop - start - np.count_nonzero(ok))
+    for arr in (out, valid):
+        if isinstance(arr, np.memmap):
+            arr.flush()
+    return {"unit": unit, "count": n, "invalid": invalid}
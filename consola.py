@@ -0,0 +1,302 @@
+"""Línea de órdenes para evaluar fórmulas sobre ficheros grandes sin pasar por la API.
+
+Uso: python -m formulas run --formula shannon entrada.csv salida.parquet [--map col=CAMPO[:PREFIJO]] ...
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from columnas import open_columns, parse_csv
+from formulas import BATCH_CHUNK, PREFIXES, REGISTRY, MissingFieldError, calculate_batch
+
+# Segundos entre informes de progreso
+PROGRESS_INTERVAL = 1.0
+
+
+# ---------- Lectura por bloques ----------
+def _csv_chunks(path: str, chunk: int):
+    """Genera (columnas, bytes leídos) leyendo ``chunk`` filas cada vez."""
+    with open(path, "rb") as f:
+        names = [n.strip() for n in f.readline().decode("utf-8-sig").split(",")]
+        while True:
+            lines = [line.decode("utf-8") for line in islice(f, chunk) if line.strip()]
+            if not lines:
+                return
+            yield parse_csv(names, lines), f.tell()
+
+
+def _parquet_chunks(path: str, chunk: int):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Para leer Parquet se necesita el paquete 'pyarrow'") from None
+    source = pq.ParquetFile(path)
+    total_rows, total_bytes, rows = source.metadata.num_rows, os.path.getsize(path), 0
+    for batch in source.iter_batches(batch_size=chunk):
+        cols = {
+            name: np.asarray(column.to_numpy(zero_copy_only=False), dtype=np.float64)
+            for name, column in zip(batch.schema.names, batch.columns)
+        }
+        rows += batch.num_rows
+        yield cols, int(total_bytes * rows / max(total_rows, 1))
+
+
+def _mapped_chunks(path: str, chunk: int):
+    """Rebanadas (vistas, sin copia) de columnas .npy/.npz mapeadas en memoria."""
+    cols = open_columns(path)
+    rows = len(next(iter(cols.values()))) if cols else 0
+    total_bytes = os.path.getsize(path)
+    for start in range(0, rows, chunk):
+        stop = min(start + chunk, rows)
+        yield {k: v[start:stop] for k, v in cols.items()}, int(total_bytes * stop / rows)
+
+
+def count_rows(path: str):
+    """Filas de una entrada mapeable (.npy/.npz) o None si hay que leerla para saberlo."""
+    if not path.endswith((".npy", ".npz")):
+        return None
+    cols = open_columns(path)
+    return len(next(iter(cols.values()))) if cols else 0
+
+
+def read_chunks(path: str, chunk: int = BATCH_CHUNK):
+    if path.endswith(".parquet"):
+        return _parquet_chunks(path, chunk)
+    if path.endswith((".npy", ".npz")):
+        return _mapped_chunks(path, chunk)
+    return _csv_chunks(path, chunk)
+
+
+# ---------- Escritura incremental ----------
+class _CsvWriter:
+    def __init__(self, path: str):
+        self.file = open(path, "w", encoding="utf-8", newline="")
+        self.names = None
+
+    def write(self, cols: dict):
+        if self.names is None:
+            self.names = list(cols)
+            self.file.write(",".join(self.names) + "\n")
+        # repr da la representación más corta que conserva el valor exacto
+        texts = [
+            map(str, cols[name].astype(np.uint8).tolist()) if cols[name].dtype == np.bool_
+            else map(repr, cols[name].tolist())
+            for name in self.names
+        ]
+        self.file.write("\n".join(map(",".join, zip(*texts))))
+        self.file.write("\n")
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Para escribir Parquet se necesita el paquete 'pyarrow'") from None
+        self.pa, self.pq, self.path, self.writer = pa, pq, path, None
+
+    def write(self, cols: dict):
+        table = self.pa.table(cols)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class _NpyWriter:
+    """Salida .npy mapeada en memoria con una sola columna: el resultado (NaN en filas inválidas)."""
+
+    def __init__(self, path: str, rows: int, column: str):
+        self.array = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(rows,))
+        self.column = column
+        self.pos = 0
+
+    def write(self, cols: dict):
+        values = cols[self.column]
+        self.array[self.pos:self.pos + len(values)] = values
+        self.pos += len(values)
+
+    def close(self):
+        self.array.flush()
+        del self.array
+
+
+def open_writer(path: str, rows: int = None, column: str = "value"):
+    if path.endswith(".parquet"):
+        return _ParquetWriter(path)
+    if path.endswith(".npy"):
+        if rows is None:
+            raise ValueError("La salida .npy necesita una entrada .npy o .npz (número de filas conocido)")
+        return _NpyWriter(path, rows, column)
+    return _CsvWriter(path)
+
+
+# ---------- Evaluación ----------
+def _parse_value(text: str) -> float:
+    """Número con prefijo SI opcional al final: "20M" -> 2e7, "4.7k" -> 4700."""
+    for symbol in sorted(PREFIXES, key=len, reverse=True):
+        if symbol and text.endswith(symbol):
+            try:
+                return float(text[: -len(symbol)]) * PREFIXES[symbol][0]
+            except ValueError:
+                break
+    return float(text)
+
+
+def _parse_map(items) -> dict:
+    """{columna: (campo, factor)} a partir de "columna=CAMPO[:PREFIJO]"."""
+    out = {}
+    for item in items or ():
+        column, sep, target = item.partition("=")
+        field, _, prefix = target.partition(":")
+        if not sep or not field:
+            raise ValueError(f"--map: se esperaba columna=CAMPO[:PREFIJO] y se recibió '{item}'")
+        if prefix not in PREFIXES:
+            raise ValueError(f"--map: prefijo SI desconocido '{prefix}'")
+        out[column] = (field, PREFIXES[prefix][0])
+    return out
+
+
+def _evaluate_chunk(formula_id: str, values: dict) -> dict:
+    res = calculate_batch(formula_id, values)
+    return {"value": res["value"], "valid": res["valid"]}
+
+
+def run(formula_id: str, source: str, target: str, mapping=None, constants=None, chunk: int = BATCH_CHUNK,
+        processes: int = 0, keep_inputs: bool = True, progress=sys.stderr) -> dict:
+    """Evalúa ``formula_id`` sobre ``source`` por bloques y escribe cada bloque en ``target`` según llega.
+
+    Las columnas se asignan a campos por nombre o con ``mapping`` ({columna: (campo, factor)});
+    ``constants`` fija campos ausentes. Con ``processes`` > 1 los bloques se reparten entre
+    procesos manteniendo el orden de salida y como mucho 2 bloques en vuelo por proceso.
+    Las entradas .npy/.npz y la salida .npy se mapean en memoria, así que el conjunto de
+    datos no tiene que caber en RAM.
+    """
+    record = REGISTRY.get(formula_id)
+    if record.vector:
+        raise ValueError(f"La fórmula '{formula_id}' usa campos por etapa y no admite entrada tabular")
+    mapping = mapping or {}
+    constants = constants or {}
+    output = record.output or "value"
+    total_bytes = os.path.getsize(source)
+    writer = open_writer(target, count_rows(source), output)
+    pool = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+    pending = deque()
+    rows, started, last_report = 0, time.perf_counter(), 0.0
+
+    def flush(block):
+        nonlocal rows, last_report
+        inputs, res = block
+        cols = dict(inputs) if keep_inputs and not target.endswith(".npy") else {}
+        cols[output] = np.where(res["valid"], res["value"], np.nan)
+        cols["valid"] = res["valid"]
+        writer.write(cols)
+        rows += len(res["valid"])
+        now = time.perf_counter()
+        if progress is not None and now - last_report >= PROGRESS_INTERVAL:
+            last_report = now
+            elapsed = now - started
+            done = read_bytes / total_bytes if total_bytes else 1.0
+            print(
+                f"\r{rows:,} filas  {done:6.1%}  {rows / elapsed:,.0f} filas/s  "
+                f"{read_bytes / elapsed / 1e6:,.1f} MB/s",
+                end="",
+                file=progress,
+                flush=True,
+            )
+
+    try:
+        read_bytes = 0
+        for cols, read_bytes in read_chunks(source, chunk):
+            n = len(next(iter(cols.values()))) if cols else 0
+            values = {}
+            for column, arr in cols.items():
+                field, factor = mapping.get(column, (column, 1.0))
+                values[field] = arr * factor if factor != 1.0 else arr
+            for field, value in constants.items():
+                values.setdefault(field, np.full(n, value))
+            missing = [f for f in record.fields if f not in values]
+            if missing:
+                raise MissingFieldError(missing[0])
+            values = {f: values[f] for f in record.fields}
+            if pool is None:
+                flush((cols, _evaluate_chunk(formula_id, values)))
+                continue
+            pending.append((cols, pool.submit(_evaluate_chunk, formula_id, values)))
+            while len(pending) >= 2 * processes or (pending and pending[0][1].done()):
+                inputs, fut = pending.popleft()
+                flush((inputs, fut.result()))
+        while pending:
+            inputs, fut = pending.popleft()
+            flush((inputs, fut.result()))
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    elapsed = time.perf_counter() - started
+    summary = {"rows": rows, "seconds": elapsed, "rows_per_second": rows / elapsed if elapsed > 0 else 0.0}
+    if progress is not None:
+        print(
+            f"\r{rows:,} filas en {elapsed:.2f} s ({summary['rows_per_second']:,.0f} filas/s)",
+            file=progress,
+            flush=True,
+        )
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m formulas", description="Calculadora de telecomunicaciones")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Muestra las fórmulas disponibles y sus campos")
+    run_parser = sub.add_parser("run", help="Evalúa una fórmula sobre un fichero CSV o Parquet")
+    run_parser.add_argument("--formula", required=True, help="Identificador de la fórmula (p. ej. shannon)")
+    run_parser.add_argument("source", help="Fichero de entrada (.csv, .parquet, o .npy/.npz mapeado en memoria)")
+    run_parser.add_argument("target", help="Fichero de salida (.csv, .parquet o .npy mapeado en memoria)")
+    run_parser.add_argument(
+        "--map", action="append", metavar="COLUMNA=CAMPO[:PREFIJO]",
+        help="Asigna una columna a un campo; el prefijo SI opcional escala los valores (p. ej. bw=B:M)",
+    )
+    run_parser.add_argument("--const", action="append", metavar="CAMPO=VALOR", help="Valor fijo, admite prefijo SI (T=290, B=20M)")
+    run_parser.add_argument("--chunk", type=int, default=BATCH_CHUNK, help="Filas por bloque")
+    run_parser.add_argument("--processes", type=int, default=0, help="Procesos de cálculo (0 = en este proceso)")
+    run_parser.add_argument("--no-inputs", action="store_true", help="No copiar las columnas de entrada a la salida")
+    run_parser.add_argument("--quiet", action="store_true", help="Sin informe de progreso")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for record in REGISTRY:
+            print(f"{record.key:16} {record.output or '':5} [{record.unit}]  campos: {', '.join(record.fields)}")
+        return 0
+    try:
+        constants = {}
+        for item in args.const or ():
+            field, sep, value = item.partition("=")
+            if not sep:
+                raise ValueError(f"--const: se esperaba CAMPO=VALOR y se recibió '{item}'")
+            constants[field] = _parse_value(value)
+        run(
+            args.formula, args.source, args.target, _parse_map(args.map), constants, args.chunk,
+            args.processes, not args.no_inputs, None if args.quiet else sys.stderr,
+        )
+    except Exception as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,24 @@
+import json
 import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable
+
+import numpy as np
 
 # Constante de Boltzmann
 K = 1.38e-23
 
+# Velocidad de la luz en el vacío (m/s)
+C_LIGHT = 299_792_458.0
+
+# 20·log10(4π/c): término constante de las pérdidas en espacio libre con d en m y f en Hz
+_FSPL_CONST_DB = 20 * math.log10(4 * math.pi / C_LIGHT)
+
 # Prefijos SI con valor y notación (para referencia del frontend)
 PREFIXES = {
     "": (1, " (10^0)"),
@@ -29,27 +45,149 @@ PREFIXES = {
 }
 
 
-def format_result(value: float, unit: str) -> str:
-    """Devuelve resultado con valor completo, prefijo SI y notación científica."""
-    if value == 0:
-        return f"0 {unit}   |   0 {unit}   |   0 {unit}"
+FORMAT_PARTS = ("normal", "prefixed", "scientific")
+_SEPARATOR = "   |   "
 
-    normal = f"{value:.6f} {unit}"
 
-    # Prefijo SI adecuado
-    prefix_text = ""
-    for symbol, (factor, _) in sorted(PREFIXES.items(), key=lambda x: -x[1][0]):
-        if factor != 1 and abs(value) >= factor:
-            scaled = value / factor
-            prefix_text = f"{scaled:.3f} {symbol}{unit}"
-            break
-    if prefix_text == "":
-        prefix_text = f"{value:.6f} {unit}"
+class SIFormatter:
+    """Formatea resultados con prefijo SI elegido por tabla indexada por exponente decimal."""
+
+    __slots__ = ("_symbols", "_factors", "_exp_min", "_table", "_np_symbols", "_np_factors")
+
+    def __init__(self, prefixes: dict):
+        ordered = sorted(
+            ((sym, factor) for sym, (factor, _) in prefixes.items() if factor != 1),
+            key=lambda x: -x[1],
+        )
+        self._symbols = tuple(sym for sym, _ in ordered)
+        self._factors = tuple(float(f) for _, f in ordered)
+        exponents = [round(math.log10(f)) for f in self._factors]
+        self._exp_min = exponents[-1]
+        # Para cada exponente decimal, índice del mayor prefijo con factor <= 10^exp
+        table = []
+        for exp in range(self._exp_min, exponents[0] + 1):
+            table.append(next(i for i, p in enumerate(exponents) if p <= exp))
+        self._table = tuple(table)
+        self._np_symbols = np.array(self._symbols + ("",))
+        self._np_factors = np.array(self._factors + (1.0,))
+
+    def _prefix_index(self, magnitude: float) -> int:
+        """Índice del prefijo (o len(symbols) si ninguno aplica)."""
+        exp = math.floor(math.log10(magnitude)) - self._exp_min
+        if exp < 0:
+            idx = len(self._factors)
+        else:
+            idx = self._table[min(exp, len(self._table) - 1)]
+        # Corrige el redondeo de log10 en las fronteras de cada década
+        factors = self._factors
+        if idx < len(factors) and magnitude < factors[idx]:
+            idx += 1
+        if idx > 0 and magnitude >= factors[idx - 1]:
+            idx -= 1
+        return idx
+
+    def parts(self, value: float, unit: str) -> tuple:
+        """Devuelve (normal, prefijo SI, científica) para un valor escalar."""
+        if value == 0:
+            zero = f"0 {unit}"
+            return zero, zero, zero
+        normal = f"{value:.6f} {unit}"
+        if not math.isfinite(value):
+            return normal, normal, normal
+
+        idx = self._prefix_index(abs(value))
+        if idx < len(self._factors):
+            prefixed = f"{value / self._factors[idx]:.3f} {self._symbols[idx]}{unit}"
+        else:
+            prefixed = normal
+
+        sci = f"{value:.6e}"
+        cut = sci.index("e")
+        return normal, prefixed, f"{sci[:cut]} × 10^{int(sci[cut + 1:])} {unit}"
+
+    def format(self, value: float, unit: str) -> str:
+        return _SEPARATOR.join(self.parts(value, unit))
+
+    def format_many(self, values, unit: str, parts=FORMAT_PARTS) -> dict:
+        """Formatea un arreglo completo; devuelve un arreglo de cadenas por cada parte pedida."""
+        unknown = set(parts) - set(FORMAT_PARTS)
+        if unknown:
+            raise ValueError(f"Formato desconocido: {', '.join(sorted(unknown))}")
+        v = np.asarray(values, dtype=np.float64).ravel()
+        if v.size == 0:
+            return {name: np.empty(0, dtype=str) for name in parts}
+        suffix = f" {unit}"
+        zero = v == 0
+        special = ~np.isfinite(v)
+
+        normal = None
+        if "normal" in parts or special.any():
+            normal = np.char.add(np.char.mod("%.6f", v), suffix)
+
+        out = {}
+        if "normal" in parts:
+            out["normal"] = normal
+        if "prefixed" in parts:
+            mag = np.abs(v)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                exp = np.floor(np.log10(mag))
+            exp = np.nan_to_num(exp, nan=-1.0, neginf=-1.0, posinf=len(self._table))
+            exp = exp.astype(np.int64) - self._exp_min
+            n = len(self._factors)
+            idx = np.where(
+                exp < 0, n, np.asarray(self._table)[np.clip(exp, 0, len(self._table) - 1)]
+            )
+            factors = self._np_factors
+            idx = np.where((idx < n) & (mag < factors[idx]), idx + 1, idx)
+            prev = np.maximum(idx - 1, 0)
+            idx = np.where((idx > 0) & (mag >= factors[prev]), prev, idx)
+            prefixed = np.char.add(
+                np.char.mod("%.3f", v / factors[idx]),
+                np.char.add(" ", np.char.add(self._np_symbols[idx], unit)),
+            )
+            if (idx == n).any():
+                fallback = np.char.add(np.char.mod("%.6f", v), suffix)
+                prefixed = np.where(idx == n, fallback, prefixed)
+            out["prefixed"] = prefixed
+        if "scientific" in parts:
+            split = np.char.partition(np.char.mod("%.6e", np.where(special, 0.0, v)), "e")
+            exps = np.char.mod("%d", split[..., 2].astype(np.int64))
+            out["scientific"] = np.char.add(
+                np.char.add(split[..., 0], " × 10^"), np.char.add(exps, suffix)
+            )
 
-    mantissa, exp = f"{value:.6e}".split("e")
-    sci = f"{float(mantissa):.6f} × 10^{int(exp)} {unit}"
+        zero_text = f"0 {unit}"
+        for name, arr in out.items():
+            if zero.any():
+                arr = np.where(zero, zero_text, arr)
+            if special.any() and name != "normal":
+                arr = np.where(special, normal, arr)
+            out[name] = arr
+        return out
 
-    return f"{normal}   |   {prefix_text}   |   {sci}"
+
+_FORMATTER = SIFormatter(PREFIXES)
+
+
+def format_result(value: float, unit: str) -> str:
+    """Devuelve resultado con valor completo, prefijo SI y notación científica."""
+    return _FORMATTER.format(value, unit)
+
+
+def format_many(values, unit: str, parts=FORMAT_PARTS, display: bool = False) -> dict:
+    """Formatea arreglos en bloque; con ``display`` añade la cadena combinada de las tres partes."""
+    needed = FORMAT_PARTS if display else parts
+    out = _FORMATTER.format_many(values, unit, needed)
+    if display:
+        if len(out["normal"]) == 0:
+            out["display"] = out["normal"]
+        else:
+            out["display"] = np.char.add(
+                np.char.add(np.char.add(out["normal"], _SEPARATOR), np.char.add(out["prefixed"], _SEPARATOR)),
+                out["scientific"],
+            )
+        out = {k: v for k, v in out.items() if k in parts or k == "display"}
+    return out
 
 
 # ---------- Cálculos ----------
@@ -77,10 +215,312 @@ def calc_noise_figure(vals):
     return 10 * math.log10(vals["F"]), "dB"
 
 
+# ---------- Cálculos vectorizados (columnas NumPy) ----------
+def vcalc_bandwidth(cols):
+    return cols["Fmax"] - cols["Fmin"], "Hz"
+
+
+def vcalc_shannon(cols):
+    return cols["B"] * np.log2(1 + (cols["S"] / cols["N"])), "bits/s"
+
+
+def vcalc_noise_power(cols):
+    return K * cols["T"] * cols["B"], "W"
+
+
+def vcalc_noise_voltage(cols):
+    return np.sqrt(4 * K * cols["R"] * cols["T"] * cols["B"]), "V"
+
+
+def vcalc_noise_factor(cols):
+    return (cols["S_in"] / cols["N_in"]) / (cols["S_out"] / cols["N_out"]), "adim"
+
+
+def vcalc_noise_figure(cols):
+    return 10 * np.log10(cols["F"]), "dB"
+
+
+# ---------- Derivadas parciales (columnas NumPy) -> {campo: ∂salida/∂campo} ----------
+_LN2 = math.log(2)
+_LN10 = math.log(10)
+
+
+def dcalc_bandwidth(cols):
+    one = np.ones(np.shape(cols["Fmax"]))
+    return {"Fmax": one, "Fmin": -one}
+
+
+def dcalc_shannon(cols):
+    B, S, N = cols["B"], cols["S"], cols["N"]
+    return {
+        "B": np.log2(1 + S / N),
+        "S": B / ((N + S) * _LN2),
+        "N": -B * S / (N * (N + S) * _LN2),
+    }
+
+
+def dcalc_noise_power(cols):
+    return {"T": K * cols["B"], "B": K * cols["T"]}
+
+
+def dcalc_noise_voltage(cols):
+    R, T, B = cols["R"], cols["T"], cols["B"]
+    v = np.sqrt(4 * K * R * T * B)
+    return {"R": 2 * K * T * B / v, "T": 2 * K * R * B / v, "B": 2 * K * R * T / v}
+
+
+def dcalc_noise_factor(cols):
+    S_in, N_in, S_out, N_out = cols["S_in"], cols["N_in"], cols["S_out"], cols["N_out"]
+    return {
+        "S_in": N_out / (N_in * S_out),
+        "N_in": -S_in * N_out / (N_in**2 * S_out),
+        "S_out": -S_in * N_out / (N_in * S_out**2),
+        "N_out": S_in / (N_in * S_out),
+    }
+
+
+def dcalc_noise_figure(cols):
+    return {"F": 10 / (cols["F"] * _LN10)}
+
+
+# ---------- Despejes analíticos (columnas conocidas, objetivo) -> incógnita ----------
+_inverse_bandwidth = {
+    "Fmax": lambda c, y: c["Fmin"] + y,
+    "Fmin": lambda c, y: c["Fmax"] - y,
+}
+
+_inverse_shannon = {
+    "B": lambda c, y: y / np.log2(1 + c["S"] / c["N"]),
+    "S": lambda c, y: c["N"] * np.expm1(y / c["B"] * math.log(2)),
+    "N": lambda c, y: c["S"] / np.expm1(y / c["B"] * math.log(2)),
+}
+
+_inverse_noise_power = {
+    "T": lambda c, y: y / (K * c["B"]),
+    "B": lambda c, y: y / (K * c["T"]),
+}
+
+_inverse_noise_voltage = {
+    "R": lambda c, y: y**2 / (4 * K * c["T"] * c["B"]),
+    "T": lambda c, y: y**2 / (4 * K * c["R"] * c["B"]),
+    "B": lambda c, y: y**2 / (4 * K * c["R"] * c["T"]),
+}
+
+_inverse_noise_factor = {
+    "S_in": lambda c, y: y * c["N_in"] * c["S_out"] / c["N_out"],
+    "N_in": lambda c, y: c["S_in"] * c["N_out"] / (y * c["S_out"]),
+    "S_out": lambda c, y: c["S_in"] * c["N_out"] / (y * c["N_in"]),
+    "N_out": lambda c, y: y * c["N_in"] * c["S_out"] / c["S_in"],
+}
+
+_inverse_noise_figure = {
+    "F": lambda c, y: 10 ** (y / 10),
+}
+
+
+# ---------- Ruido en cascada (Friis) ----------
+def friis_cascade(F, G):
+    """Factor de ruido total de cadenas de etapas: F1 + (F2 − 1)/G1 + (F3 − 1)/(G1·G2) + …
+
+    ``F`` y ``G`` son arreglos (etapas,) o (cadenas, etapas) en unidades lineales. Las cadenas
+    más cortas pueden rellenarse con etapas neutras F = 1, G = 1.
+    """
+    F = np.asarray(F, dtype=np.float64)
+    G = np.asarray(G, dtype=np.float64)
+    if F.shape[-1:] != G.shape[-1:]:
+        raise ValueError("F y G deben tener el mismo número de etapas")
+    if F.shape[-1] == 0:
+        raise ValueError("La cadena debe tener al menos una etapa")
+    # Ganancia acumulada antes de cada etapa (la de la última etapa no interviene)
+    gain_before = np.cumprod(G[..., :-1], axis=-1)
+    return F[..., 0] + np.sum((F[..., 1:] - 1) / gain_before, axis=-1)
+
+
+def dcalc_cascade_noise(cols):
+    """∂F/∂Fᵢ = 1/(G₁···Gᵢ₋₁) y ∂F/∂Gⱼ = −Σᵢ₌ⱼ₊₁ (Fᵢ − 1)/(G₁···Gᵢ₋₁) / Gⱼ, por etapa."""
+    F = np.asarray(cols["F"], dtype=np.float64)
+    G = np.asarray(cols["G"], dtype=np.float64)
+    gain_before = np.concatenate([np.ones(F.shape[:-1] + (1,)), np.cumprod(G[..., :-1], axis=-1)], axis=-1)
+    terms = (F - 1) / gain_before
+    terms[..., 0] = 0.0
+    # Suma de los términos de las etapas posteriores a cada una
+    after = np.cumsum(terms[..., ::-1], axis=-1)[..., ::-1] - terms
+    return {"F": 1 / gain_before, "G": (0.0 - after) / G}
+
+
+def calc_cascade_noise(vals):
+    F, G = np.atleast_1d(vals["F"]).tolist(), np.atleast_1d(vals["G"]).tolist()
+    if len(F) != len(G):
+        raise ValueError("F y G deben tener el mismo número de etapas")
+    if not F:
+        raise ValueError("La cadena debe tener al menos una etapa")
+    total, gain = F[0], 1.0
+    for i in range(1, len(F)):
+        gain *= G[i - 1]
+        total += (F[i] - 1) / gain
+    return total, "adim"
+
+
+def vcalc_cascade_noise(cols):
+    return friis_cascade(cols["F"], cols["G"]), "adim"
+
+
+# ---------- Balance de enlace ----------
+def link_budget(d, f, B, Pt=1.0, Gt=0.0, Gr=0.0, L=0.0, T=290.0, NF=0.0) -> dict:
+    """Encadena pérdidas en espacio libre, ganancias, pérdidas de cable, ruido K·T·B·F, SNR y Shannon.
+
+    Todos los parámetros admiten arreglos y se combinan por broadcasting. Pt en W, ganancias en
+    dBi, pérdidas e índice de ruido en dB, d en m, f y B en Hz, T en K.
+    """
+    with np.errstate(all="ignore"):
+        fspl = 20 * np.log10(d) + 20 * np.log10(f) + _FSPL_CONST_DB
+        prx = Pt * 10 ** ((Gt + Gr - L - fspl) / 10)
+        noise = K * T * B * 10 ** (np.asarray(NF) / 10)
+        snr = prx / noise
+        capacity = B * np.log1p(snr) / math.log(2)
+        return {
+            "fspl_db": fspl,
+            "prx_dbm": 10 * np.log10(prx) + 30,
+            "noise_w": noise,
+            "snr_db": 10 * np.log10(snr),
+            "capacity": capacity,
+        }
+
+
+def link_budget_grid(distances, frequencies, bandwidths, **params) -> dict:
+    """Evalúa el balance sobre la rejilla distancia × frecuencia × ancho de banda en una pasada.
+
+    Cada resultado tiene forma (len(distances), len(frequencies), len(bandwidths)).
+    """
+    d, f, B = np.ix_(
+        np.asarray(distances, dtype=np.float64),
+        np.asarray(frequencies, dtype=np.float64),
+        np.asarray(bandwidths, dtype=np.float64),
+    )
+    out = link_budget(d, f, B, **params)
+    shape = (d.shape[0], f.shape[1], B.shape[2])
+    return {k: np.broadcast_to(v, shape) for k, v in out.items()}
+
+
+def calc_fspl(vals):
+    return 20 * math.log10(vals["d"]) + 20 * math.log10(vals["f"]) + _FSPL_CONST_DB, "dB"
+
+
+def vcalc_fspl(cols):
+    return 20 * np.log10(cols["d"]) + 20 * np.log10(cols["f"]) + _FSPL_CONST_DB, "dB"
+
+
+def dcalc_fspl(cols):
+    return {"d": 20 / (cols["d"] * _LN10), "f": 20 / (cols["f"] * _LN10)}
+
+
+def dcalc_link_budget(cols):
+    """Regla de la cadena a través de la SNR: ∂C/∂x = B·snr/((1 + snr)·ln 2) · ∂ln(snr)/∂x."""
+    B = cols["B"]
+    snr = 10 ** (link_budget(
+        cols["d"], cols["f"], B, cols["Pt"], cols["Gt"], cols["Gr"], cols["L"], cols["T"], cols["NF"]
+    )["snr_db"] / 10)
+    scale = B * snr / ((1 + snr) * _LN2)
+    db = scale * _LN10 / 10
+    return {
+        "Pt": scale / cols["Pt"],
+        "Gt": db,
+        "Gr": db,
+        "L": -db,
+        "d": -2 * scale / cols["d"],
+        "f": -2 * scale / cols["f"],
+        "B": np.log1p(snr) / _LN2 - scale / B,
+        "T": -scale / cols["T"],
+        "NF": -db,
+    }
+
+
+_inverse_fspl = {
+    "d": lambda c, y: 10 ** ((y - _FSPL_CONST_DB) / 20) / c["f"],
+    "f": lambda c, y: 10 ** ((y - _FSPL_CONST_DB) / 20) / c["d"],
+}
+
+
+def calc_link_budget(vals):
+    fspl = calc_fspl(vals)[0]
+    prx = vals["Pt"] * 10 ** ((vals["Gt"] + vals["Gr"] - vals["L"] - fspl) / 10)
+    noise = K * vals["T"] * vals["B"] * 10 ** (vals["NF"] / 10)
+    return vals["B"] * math.log1p(prx / noise) / math.log(2), "bits/s"
+
+
+def vcalc_link_budget(cols):
+    res = link_budget(
+        cols["d"], cols["f"], cols["B"], cols["Pt"], cols["Gt"], cols["Gr"], cols["L"], cols["T"], cols["NF"]
+    )
+    return res["capacity"], "bits/s"
+
+
+# ---------- Reparto de potencia por water-filling ----------
+def water_filling(gain, noise, power, df=1.0) -> dict:
+    """Reparto óptimo de ``power`` entre subportadoras y capacidad resultante.
+
+    ``gain`` y ``noise`` son arreglos (subportadoras,) o (realizaciones, subportadoras); ``power``
+    y ``df`` (ancho de banda de cada subportadora) son escalares o uno por realización. Con
+    aᵢ = Nᵢ/Gᵢ ordenados de menor a mayor, el nivel de agua con las m mejores subportadoras es
+    μₘ = (P + a₁ + … + aₘ)/m, y se toma el mayor m con μₘ > aₘ (sumas prefijas, sin bisección).
+    Devuelve capacidad (bits/s), nivel μ, subportadoras activas y potencia de cada subportadora.
+    """
+    gain = np.asarray(gain, dtype=np.float64)
+    noise = np.asarray(noise, dtype=np.float64)
+    with np.errstate(all="ignore"):
+        a = noise / gain
+        a = np.where(np.isnan(a), np.inf, a)
+        ordered = np.sort(a, axis=-1)
+        m = np.arange(1, a.shape[-1] + 1)
+        power = np.asarray(power, dtype=np.float64)[..., None]
+        levels = (power + np.cumsum(ordered, axis=-1)) / m
+        # La condición se cumple en un prefijo: el número de aciertos es el m óptimo
+        active = np.count_nonzero(levels > ordered, axis=-1)
+        mu = np.take_along_axis(levels, np.maximum(active - 1, 0)[..., None], axis=-1)[..., 0]
+        mu = np.where(active > 0, mu, np.nan)
+        alloc = np.maximum(mu[..., None] - a, 0.0)
+        capacity = np.asarray(df) * np.sum(np.log2(1 + alloc / a), axis=-1)
+    return {"capacity": capacity, "level": mu, "active": active, "power": alloc}
+
+
+def calc_water_filling(vals):
+    G, N = np.atleast_1d(vals["G"]), np.atleast_1d(vals["N"])
+    if G.shape != N.shape:
+        raise ValueError("G y N deben tener el mismo número de subportadoras")
+    if G.size == 0:
+        raise ValueError("Se necesita al menos una subportadora")
+    if vals["P"] <= 0:
+        raise ValueError("La potencia total debe ser positiva")
+    capacity = float(water_filling(G, N, vals["P"], vals["df"])["capacity"])
+    if not math.isfinite(capacity):
+        raise ValueError("Ninguna subportadora utilizable (G > 0 y N > 0)")
+    return capacity, "bits/s"
+
+
+def vcalc_water_filling(cols):
+    return water_filling(cols["G"], cols["N"], cols["P"], cols["df"])["capacity"], "bits/s"
+
+
+def dcalc_water_filling(cols):
+    """Por el teorema de la envolvente: ∂C/∂P = df/(μ·ln 2), ∂C/∂Gᵢ = df·pᵢ/(μ·Gᵢ·ln 2), ∂C/∂Nᵢ = −df·pᵢ/(μ·Nᵢ·ln 2)."""
+    G, N, df = cols["G"], cols["N"], cols["df"]
+    res = water_filling(G, N, cols["P"], df)
+    mu, alloc = res["level"][..., None], res["power"]
+    scale = np.asarray(df)[..., None] / (mu * _LN2)
+    return {
+        "G": scale * alloc / G,
+        "N": scale * (0.0 - alloc) / N,
+        "P": np.asarray(df) / (res["level"] * _LN2),
+        "df": res["capacity"] / df,
+    }
+
+
 # ---------- Especificación de fórmulas ----------
 FORMULAS = {
     "1. Ancho de banda": {
         "key": "bandwidth",
+        "output": "B",
+        "unit": "Hz",
         "desc": "B = Fmax − Fmin",
         "explain": "Calcula el rango de frecuencias ocupadas por una señal.",
         "fields": [
@@ -88,9 +528,14 @@ FORMULAS = {
             ("Fmin", "Frecuencia mínima", "Hz"),
         ],
         "fn": calc_bandwidth,
+        "vfn": vcalc_bandwidth,
+        "jfn": dcalc_bandwidth,
+        "inverse": _inverse_bandwidth,
     },
     "2. Límite de Shannon": {
         "key": "shannon",
+        "output": "I",
+        "unit": "bits/s",
         "desc": "I = B · log₂(1 + S/N)",
         "explain": "Capacidad máxima teórica de un canal en bits/s.",
         "fields": [
@@ -99,9 +544,14 @@ FORMULAS = {
             ("N", "Potencia de ruido (N)", "W"),
         ],
         "fn": calc_shannon,
+        "vfn": vcalc_shannon,
+        "jfn": dcalc_shannon,
+        "inverse": _inverse_shannon,
     },
     "3. Potencia de ruido térmico": {
         "key": "noise_power",
+        "output": "N",
+        "unit": "W",
         "desc": "N = K · T · B",
         "explain": "Potencia de ruido generada por agitación térmica.",
         "fields": [
@@ -109,9 +559,14 @@ FORMULAS = {
             ("B", "Ancho de banda", "Hz"),
         ],
         "fn": calc_noise_power,
+        "vfn": vcalc_noise_power,
+        "jfn": dcalc_noise_power,
+        "inverse": _inverse_noise_power,
     },
     "4. Voltaje de ruido térmico": {
         "key": "noise_voltage",
+        "output": "Vn",
+        "unit": "V",
         "desc": "Vn = √(4 · K · R · T · B)",
         "explain": "Voltaje equivalente del ruido térmico en una resistencia.",
         "fields": [
@@ -120,9 +575,14 @@ FORMULAS = {
             ("B", "Ancho de banda", "Hz"),
         ],
         "fn": calc_noise_voltage,
+        "vfn": vcalc_noise_voltage,
+        "jfn": dcalc_noise_voltage,
+        "inverse": _inverse_noise_voltage,
     },
     "5. Factor de ruido": {
         "key": "noise_factor",
+        "output": "F",
+        "unit": "adim",
         "desc": "F = (S/N)in / (S/N)out",
         "explain": "Degradación de la relación señal/ruido al pasar por un dispositivo.",
         "fields": [
@@ -132,47 +592,1087 @@ FORMULAS = {
             ("N_out", "Ruido de salida (N_out)", "W"),
         ],
         "fn": calc_noise_factor,
+        "vfn": vcalc_noise_factor,
+        "jfn": dcalc_noise_factor,
+        "inverse": _inverse_noise_factor,
     },
     "6. Índice de ruido": {
         "key": "noise_figure",
+        "output": "NF",
+        "unit": "dB",
         "desc": "NF(dB) = 10 · log₁₀(F)",
         "explain": "Factor de ruido convertido a decibelios.",
         "fields": [
             ("F", "Factor de ruido (F)", "adim"),
         ],
         "fn": calc_noise_figure,
+        "vfn": vcalc_noise_figure,
+        "jfn": dcalc_noise_figure,
+        "inverse": _inverse_noise_figure,
+    },
+    "7. Ruido en cascada (Friis)": {
+        "key": "cascade_noise",
+        "output": "F",
+        "unit": "adim",
+        "desc": "F = F₁ + (F₂ − 1)/G₁ + (F₃ − 1)/(G₁·G₂) + …",
+        "explain": "Factor de ruido total de una cadena de etapas (LNA, mezclador, filtro, FI…).",
+        "fields": [
+            ("F", "Factores de ruido por etapa", "adim"),
+            ("G", "Ganancias por etapa", "adim"),
+        ],
+        "vector": ("F", "G"),
+        "fn": calc_cascade_noise,
+        "vfn": vcalc_cascade_noise,
+        "jfn": dcalc_cascade_noise,
+    },
+    "8. Pérdidas en espacio libre": {
+        "key": "fspl",
+        "output": "FSPL",
+        "unit": "dB",
+        "desc": "FSPL = 20 · log₁₀(d) + 20 · log₁₀(f) + 20 · log₁₀(4π/c)",
+        "explain": "Atenuación de la señal al propagarse en el vacío entre dos antenas isotrópicas.",
+        "fields": [
+            ("d", "Distancia", "m"),
+            ("f", "Frecuencia", "Hz"),
+        ],
+        "fn": calc_fspl,
+        "vfn": vcalc_fspl,
+        "jfn": dcalc_fspl,
+        "inverse": _inverse_fspl,
+    },
+    "9. Balance de enlace": {
+        "key": "link_budget",
+        "output": "C",
+        "unit": "bits/s",
+        "desc": "C = B · log₂(1 + Pt·Gt·Gr / (L · FSPL · K·T·B·F))",
+        "explain": "Capacidad de un enlace radio a partir de la potencia transmitida, las antenas, "
+        "las pérdidas y el ruido del receptor.",
+        "fields": [
+            ("Pt", "Potencia transmitida", "W"),
+            ("Gt", "Ganancia de antena TX", "dBi"),
+            ("Gr", "Ganancia de antena RX", "dBi"),
+            ("L", "Pérdidas de cable", "dB"),
+            ("d", "Distancia", "m"),
+            ("f", "Frecuencia", "Hz"),
+            ("B", "Ancho de banda", "Hz"),
+            ("T", "Temperatura", "K"),
+            ("NF", "Índice de ruido del receptor", "dB"),
+        ],
+        "fn": calc_link_budget,
+        "vfn": vcalc_link_budget,
+        "jfn": dcalc_link_budget,
+    },
+    "10. Capacidad con water-filling": {
+        "key": "water_filling",
+        "output": "C",
+        "unit": "bits/s",
+        "desc": "C = Δf · Σ log₂(1 + pᵢ·Gᵢ/Nᵢ),  pᵢ = max(0, μ − Nᵢ/Gᵢ),  Σ pᵢ = P",
+        "explain": "Capacidad de un canal multiportadora (OFDM) repartiendo la potencia total "
+        "de forma óptima entre subportadoras.",
+        "fields": [
+            ("G", "Ganancias por subportadora", "adim"),
+            ("N", "Potencias de ruido por subportadora", "W"),
+            ("P", "Potencia total", "W"),
+            ("df", "Ancho de banda por subportadora", "Hz"),
+        ],
+        "vector": ("G", "N"),
+        "fn": calc_water_filling,
+        "vfn": vcalc_water_filling,
+        "jfn": dcalc_water_filling,
     },
 }
 
 
+class UnknownFormulaError(ValueError):
+    """La fórmula solicitada no existe en el catálogo."""
+
+    def __init__(self, formula_id: str = ""):
+        super().__init__("Fórmula no encontrada")
+        self.formula_id = formula_id
+
+
+class MissingFieldError(ValueError):
+    """Falta el valor de un campo que la fórmula necesita."""
+
+    def __init__(self, field: str):
+        super().__init__(f"Falta el valor de '{field}'.")
+        self.field = field
+
+
+@dataclass(frozen=True, slots=True)
+class FormulaRecord:
+    """Metadatos precompilados de una fórmula: evaluadores, orden de campos y unidades."""
+
+    key: str
+    title: str
+    desc: str
+    explain: str
+    unit: str
+    fields: tuple
+    labels: tuple
+    units: tuple
+    fn: Callable
+    vfn: Callable
+    vector: tuple = ()
+    output: str = ""
+    inverse: dict = field(default=None, compare=False)
+    jfn: Callable = None
+
+    @classmethod
+    def from_spec(cls, title: str, spec: dict) -> "FormulaRecord":
+        names, labels, units = zip(*spec["fields"]) if spec["fields"] else ((), (), ())
+        return cls(
+            key=spec["key"],
+            title=title,
+            desc=spec["desc"],
+            explain=spec["explain"],
+            unit=spec.get("unit", ""),
+            fields=tuple(names),
+            labels=tuple(labels),
+            units=tuple(units),
+            fn=spec["fn"],
+            vfn=spec["vfn"],
+            vector=tuple(spec.get("vector", ())),
+            output=spec.get("output", ""),
+            inverse=dict(spec.get("inverse", {})),
+            jfn=spec.get("jfn"),
+        )
+
+    def as_api_dict(self) -> dict:
+        return {
+            "title": self.title,
+            "id": self.key,
+            "output": self.output,
+            "desc": self.desc,
+            "explain": self.explain,
+            "fields": [
+                {"name": n, "label": l, "unit": u, **({"vector": True} if n in self.vector else {})}
+                for (n, l, u) in zip(self.fields, self.labels, self.units)
+            ],
+        }
+
+
+def _encode_json(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FormulaRegistry:
+    """Índice de fórmulas por id y por título, con la respuesta de /formulas pre-codificada."""
+
+    __slots__ = ("_by_id", "_by_title", "_api_items", "_encoded_items", "_json")
+
+    def __init__(self):
+        self._by_id = {}
+        self._by_title = {}
+        self._api_items = []
+        self._encoded_items = []
+        self._json = None
+
+    def register(self, title: str, spec: dict) -> FormulaRecord:
+        record = FormulaRecord.from_spec(title, spec)
+        if record.key in self._by_id or title in self._by_title:
+            raise ValueError(f"La fórmula '{record.key}' ya está registrada")
+        self._by_id[record.key] = record
+        self._by_title[title] = record
+        item = record.as_api_dict()
+        self._api_items.append(item)
+        self._encoded_items.append(_encode_json(item))
+        self._json = None
+        return record
+
+    def get(self, formula_id: str) -> FormulaRecord:
+        try:
+            return self._by_id[formula_id]
+        except KeyError:
+            raise UnknownFormulaError(formula_id) from None
+
+    def by_title(self, title: str) -> FormulaRecord:
+        try:
+            return self._by_title[title]
+        except KeyError:
+            raise UnknownFormulaError(title) from None
+
+    def __contains__(self, formula_id) -> bool:
+        return formula_id in self._by_id
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def api_list(self) -> list:
+        return self._api_items
+
+    def formulas_json(self) -> bytes:
+        if self._json is None:
+            self._json = b"[" + b",".join(self._encoded_items) + b"]"
+        return self._json
+
+
+REGISTRY = FormulaRegistry()
+for _title, _spec in FORMULAS.items():
+    REGISTRY.register(_title, _spec)
+
+PREFIXES_JSON = _encode_json(PREFIXES)
+
+
+def register_formula(title: str, spec: dict) -> FormulaRecord:
+    """Añade una fórmula al catálogo y al registro."""
+    record = REGISTRY.register(title, spec)
+    FORMULAS[title] = spec
+    _derivation_plan.cache_clear()
+    return record
+
+
 def list_formulas_for_api():
     """Devuelve metadatos de fórmulas sin funciones, serializables a JSON."""
-    items = []
-    for title, spec in FORMULAS.items():
-        items.append(
-            {
-                "title": title,
-                "id": spec["key"],
-                "desc": spec["desc"],
-                "explain": spec["explain"],
-                "fields": [
-                    {"name": n, "label": l, "unit": u} for (n, l, u) in spec["fields"]
-                ],
+    return REGISTRY.api_list()
+
+
+class ResultCache:
+    """Caché LRU de resultados de calculate_by_id, acotada por número de entradas y antigüedad."""
+
+    __slots__ = ("maxsize", "ttl", "_data", "_lock", "hits", "misses", "evictions", "expirations")
+
+    def __init__(self, maxsize: int = 4096, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires, entry = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry: dict):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, entry)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": True,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
             }
+
+
+_RESULT_CACHE = None
+
+
+def configure_cache(maxsize: int = 4096, ttl: float = None):
+    """Activa la caché de resultados en este proceso (``maxsize`` 0 la desactiva)."""
+    global _RESULT_CACHE
+    _RESULT_CACHE = ResultCache(maxsize, ttl) if maxsize > 0 else None
+
+
+def cache_stats() -> dict:
+    return _RESULT_CACHE.stats() if _RESULT_CACHE is not None else {"enabled": False}
+
+
+def _cache_key(record: FormulaRecord, values: dict):
+    """Clave (id, valores normalizados en el orden de los campos) o None si no es cacheable."""
+    try:
+        return record.key, tuple(
+            tuple(map(float, values[f])) if f in record.vector else float(values[f]) for f in record.fields
         )
-    return items
+    except (KeyError, TypeError, ValueError):
+        return None
 
 
-def calculate_by_id(formula_id: str, values: dict):
-    """Calcula por identificador estable y devuelve dict con resultado y unidad."""
-    for _title, spec in FORMULAS.items():
-        if spec["key"] == formula_id:
-            result, unit = spec["fn"](values)
-            return {
-                "value": result,
-                "unit": unit,
-                "display": format_result(result, unit),
+def calculate_by_id(formula_id: str, values: dict, display: bool = True, timings: dict = None):
+    """Calcula por identificador estable y devuelve dict con resultado y unidad.
+
+    Con ``timings`` acumula en sus claves "compute" y "format" los segundos de cada parte
+    (un acierto de caché cuenta como cálculo).
+    """
+    started = time.perf_counter()
+    record = REGISTRY.get(formula_id)
+    for name in record.fields:
+        if name not in record.vector and isinstance(values.get(name), (list, tuple)):
+            raise ValueError(f"El campo '{name}' admite un solo valor, no una lista")
+    cache = _RESULT_CACHE
+    key = _cache_key(record, values) if cache is not None else None
+    entry = cache.get(key) if key is not None else None
+    if entry is not None and (not display or "display" in entry):
+        out = dict(entry)
+        if not display:
+            out.pop("display", None)
+        if timings is not None:
+            timings["compute"] = timings.get("compute", 0.0) + time.perf_counter() - started
+        return out
+    if entry is None:
+        result, unit = record.fn(values)
+        entry = {"value": result, "unit": unit}
+    computed = time.perf_counter()
+    if display:
+        entry = {**entry, "display": format_result(entry["value"], entry["unit"])}
+    if key is not None:
+        cache.put(key, entry)
+    if timings is not None:
+        timings["compute"] = timings.get("compute", 0.0) + computed - started
+        timings["format"] = timings.get("format", 0.0) + time.perf_counter() - computed
+    return dict(entry)
+
+
+if os.environ.get("FORMULAS_CACHE_SIZE"):
+    configure_cache(
+        int(os.environ["FORMULAS_CACHE_SIZE"]),
+        float(os.environ["FORMULAS_CACHE_TTL"]) if os.environ.get("FORMULAS_CACHE_TTL") else None,
+    )
+
+
+def as_columns(fields, values: dict, vector=(), cast: bool = True):
+    """Convierte los valores recibidos en columnas float64 con el mismo número de filas.
+
+    Los campos de ``vector`` son matrices (filas, etapas); un escalar o una sola fila se
+    repiten en todas las filas. Con ``cast=False`` los arreglos numéricos de otro tipo (p. ej.
+    memmaps float32) se dejan tal cual para convertirlos bloque a bloque sin copiarlos enteros.
+    """
+    cols = {}
+    for name in fields:
+        if name not in values:
+            raise MissingFieldError(name)
+        raw = values[name]
+        if not cast and isinstance(raw, np.ndarray) and raw.dtype.kind in "biuf":
+            arr = raw
+        else:
+            arr = np.asarray(raw, dtype=np.float64)
+        cols[name] = np.atleast_2d(arr) if name in vector else np.atleast_1d(arr)
+        if cols[name].ndim != (2 if name in vector else 1):
+            raise ValueError(f"Dimensiones no válidas para '{name}'")
+    rows = {len(arr) for arr in cols.values()} - {1}
+    if len(rows) > 1:
+        raise ValueError("Las columnas deben tener la misma longitud")
+    n = rows.pop() if rows else 1
+    return {
+        name: arr if len(arr) == n else np.broadcast_to(arr, (n,) + arr.shape[1:])
+        for name, arr in cols.items()
+    }
+
+
+def evaluate_columns(record: FormulaRecord, cols: dict):
+    """Aplica el evaluador vectorizado y devuelve (resultado, unidad, máscara de validez)."""
+    with np.errstate(all="ignore"):
+        result, unit = record.vfn(cols)
+    result = np.asarray(result, dtype=np.float64)
+    return result, unit, np.isfinite(result)
+
+
+def _evaluate_partials(record: FormulaRecord, cols: dict) -> dict:
+    """Derivadas parciales analíticas de la salida respecto a cada campo, con la forma de su columna."""
+    if record.jfn is None:
+        raise ValueError(f"La fórmula '{record.key}' no tiene derivadas analíticas")
+    with np.errstate(all="ignore"):
+        partials = record.jfn(cols)
+    return {
+        name: np.broadcast_to(np.asarray(partials[name], dtype=np.float64), cols[name].shape)
+        for name in record.fields
+    }
+
+
+def partial_units(formula_id: str) -> dict:
+    """Unidad de cada derivada parcial: unidad de salida / unidad del campo."""
+    record = REGISTRY.get(formula_id)
+    return {name: f"{record.unit}/{unit}" for name, unit in zip(record.fields, record.units)}
+
+
+def calculate_batch(formula_id: str, values: dict, formats=(), jacobian: bool = False):
+    """Evalúa una fórmula sobre columnas de valores; los errores de dominio se marcan en ``valid``.
+
+    ``formats`` admite cualquier subconjunto de FORMAT_PARTS y "display". Con ``jacobian`` añade
+    ``partials``: la derivada analítica de la salida respecto a cada campo, fila a fila.
+    """
+    record = REGISTRY.get(formula_id)
+    cols = as_columns(record.fields, values, record.vector)
+    result, unit, valid = evaluate_columns(record, cols)
+    out = {"value": result, "unit": unit, "valid": valid}
+    if jacobian:
+        out["partials"] = _evaluate_partials(record, cols)
+    if formats:
+        parts = tuple(p for p in formats if p != "display")
+        out["formats"] = format_many(result, unit, parts, display="display" in formats)
+    return out
+
+
+def calculate_many(formula_id: str, requests: list, display: bool = True) -> list:
+    """Evalúa varias peticiones independientes de la misma fórmula en una sola pasada vectorizada.
+
+    Devuelve, en orden, lo mismo que calculate_by_id para cada elemento de ``requests`` (dicts
+    de valores) o la excepción que habría lanzado. Solo se vectorizan las peticiones cuyos campos
+    son todos escalares; las demás y las filas con errores de dominio se recalculan una a una,
+    así una petición mal formada no arrastra al resto y conserva exactamente su mensaje de error.
+    Con la caché de resultados activa, los aciertos no se recalculan y lo vectorizado se guarda.
+    """
+    record = REGISTRY.get(formula_id)
+    out = [None] * len(requests)
+    rows = []
+    if not record.vector:
+        rows = [
+            i for i, vals in enumerate(requests)
+            if all(isinstance(vals.get(f), (int, float)) for f in record.fields)
+        ]
+    cache = _RESULT_CACHE
+    keys = {}
+    if cache is not None:
+        pending = []
+        for i in rows:
+            key = keys[i] = _cache_key(record, requests[i])
+            entry = cache.get(key)
+            if entry is not None and (not display or "display" in entry):
+                out[i] = dict(entry)
+                if not display:
+                    out[i].pop("display", None)
+            else:
+                pending.append(i)
+        rows = pending
+    if rows:
+        cols = {
+            f: np.fromiter((requests[i][f] for i in rows), dtype=np.float64, count=len(rows))
+            for f in record.fields
+        }
+        result, unit, valid = evaluate_columns(record, cols)
+        ok = np.flatnonzero(valid)
+        texts = format_many(result[ok], unit, (), display=True)["display"] if display else None
+        for j, k in enumerate(ok.tolist()):
+            entry = {"value": float(result[k]), "unit": unit}
+            if display:
+                entry["display"] = str(texts[j])
+            if cache is not None:
+                cache.put(keys[rows[k]], entry)
+            out[rows[k]] = dict(entry)
+    for i, vals in enumerate(requests):
+        if out[i] is None:
+            try:
+                out[i] = calculate_by_id(formula_id, vals, display)
+            except Exception as e:
+                out[i] = e
+    return out
+
+
+BATCH_CHUNK = 1 << 16
+
+
+def calculate_batch_chunks(
+    formula_id: str, values: dict, chunk_size: int = BATCH_CHUNK, formats=(), jacobian: bool = False
+):
+    """Como calculate_batch, pero devuelve un generador de (offset, resultado) por bloques de filas.
+
+    La validación se hace al llamar, antes de generar el primer bloque.
+    """
+    record = REGISTRY.get(formula_id)
+    if jacobian and record.jfn is None:
+        raise ValueError(f"La fórmula '{record.key}' no tiene derivadas analíticas")
+    cols = as_columns(record.fields, values, record.vector, cast=False)
+    return _batch_chunks(record, cols, chunk_size, formats, jacobian)
+
+
+def _batch_chunks(record: FormulaRecord, cols: dict, chunk_size: int, formats, jacobian: bool = False):
+    n = len(next(iter(cols.values()))) if cols else 0
+    parts = tuple(p for p in formats if p != "display")
+    for start in range(0, n, chunk_size):
+        block = {k: np.asarray(v[start:start + chunk_size], dtype=np.float64) for k, v in cols.items()}
+        result, unit, valid = evaluate_columns(record, block)
+        out = {"value": result, "unit": unit, "valid": valid}
+        if jacobian:
+            out["partials"] = _evaluate_partials(record, block)
+        if formats:
+            out["formats"] = format_many(result, unit, parts, display="display" in formats)
+        yield start, out
+
+
+# ---------- Barridos de parámetros ----------
+SWEEP_CHUNK = 1 << 16
+
+
+@dataclass(frozen=True, slots=True)
+class SweepRange:
+    """Eje de barrido: ``num`` puntos entre ``start`` y ``stop`` en escala lineal o logarítmica.
+
+    El eje no se guarda: ``at`` calcula los valores de los índices pedidos, así que su coste no
+    depende de ``num``.
+    """
+
+    start: float
+    stop: float
+    num: int
+    scale: str = "linear"
+
+    def __post_init__(self):
+        if self.num < 1:
+            raise ValueError("El número de puntos del barrido debe ser positivo")
+        if self.scale not in ("linear", "log"):
+            raise ValueError(f"Escala desconocida: '{self.scale}'")
+        if self.scale == "log" and (self.start <= 0 or self.stop <= 0):
+            raise ValueError("La escala logarítmica requiere límites positivos")
+
+    @classmethod
+    def from_spec(cls, spec) -> "SweepRange":
+        if isinstance(spec, SweepRange):
+            return spec
+        return cls(float(spec["start"]), float(spec["stop"]), int(spec["num"]), spec.get("scale", "linear"))
+
+    def __len__(self) -> int:
+        return self.num
+
+    def at(self, index) -> np.ndarray:
+        """Valores de los índices ``index``; coinciden con np.linspace / np.geomspace."""
+        index = np.asarray(index)
+        last = self.num - 1
+        if self.scale == "linear":
+            lo, hi = self.start, self.stop
+        else:
+            lo, hi = math.log10(self.start), math.log10(self.stop)
+        out = lo + index * ((hi - lo) / last if last else 0.0)
+        if self.scale == "log":
+            out = np.power(10.0, out)
+        return np.where(index == 0, self.start, np.where(index == last, self.stop, out))
+
+    def values(self) -> np.ndarray:
+        return self.at(np.arange(self.num))
+
+
+class SweepGrid:
+    """Producto cartesiano de ejes sobre los campos de una fórmula, evaluable por bloques."""
+
+    __slots__ = ("record", "names", "axes", "fixed", "shape", "size")
+
+    def __init__(self, formula_id: str, ranges: dict, fixed: dict = None):
+        self.record = REGISTRY.get(formula_id)
+        if self.record.vector:
+            raise ValueError(f"La fórmula '{formula_id}' no admite barridos")
+        fixed = dict(fixed or {})
+        for name in list(ranges) + list(fixed):
+            if name not in self.record.fields:
+                raise ValueError(f"El campo '{name}' no pertenece a la fórmula")
+        overlap = set(ranges) & set(fixed)
+        if overlap:
+            raise ValueError(f"Campos fijos y barridos a la vez: {', '.join(sorted(overlap))}")
+        for name in self.record.fields:
+            if name not in ranges and name not in fixed:
+                raise MissingFieldError(name)
+        self.names = tuple(n for n in self.record.fields if n in ranges)
+        self.axes = tuple(SweepRange.from_spec(ranges[n]) for n in self.names)
+        self.fixed = {n: float(v) for n, v in fixed.items()}
+        self.shape = tuple(a.num for a in self.axes)
+        self.size = math.prod(self.shape)
+
+    @property
+    def unit(self) -> str:
+        return self.record.unit
+
+    def chunk(self, start: int, stop: int) -> dict:
+        """Evalúa los puntos de índice plano [start, stop) y devuelve columnas."""
+        idx = np.arange(start, min(stop, self.size))
+        coords = np.unravel_index(idx, self.shape) if self.shape else ()
+        cols = {n: axis.at(c) for n, axis, c in zip(self.names, self.axes, coords)}
+        inputs = dict(cols)
+        for n, v in self.fixed.items():
+            inputs[n] = np.full(idx.size, v)
+        result, _unit, valid = evaluate_columns(self.record, inputs)
+        cols["value"] = result
+        cols["valid"] = valid
+        return cols
+
+    def chunks(self, chunk_size: int = SWEEP_CHUNK):
+        """Genera bloques de columnas sin materializar la rejilla completa."""
+        for start in range(0, self.size, chunk_size):
+            yield self.chunk(start, start + chunk_size)
+
+
+def sweep_chunks(formula_id: str, ranges: dict, fixed: dict = None, chunk_size: int = SWEEP_CHUNK):
+    """Barrido cartesiano por bloques de como máximo ``chunk_size`` puntos."""
+    return SweepGrid(formula_id, ranges, fixed).chunks(chunk_size)
+
+
+def sweep(formula_id: str, ranges: dict, fixed: dict = None, chunk_size: int = SWEEP_CHUNK) -> dict:
+    """Evalúa la rejilla completa y devuelve columnas (campos barridos, ``value`` y ``valid``)."""
+    grid = SweepGrid(formula_id, ranges, fixed)
+    parts = list(grid.chunks(chunk_size))
+    if not parts:
+        cols = {n: np.empty(0) for n in grid.names}
+        cols.update(value=np.empty(0), valid=np.empty(0, dtype=bool))
+    else:
+        cols = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    return {"unit": grid.unit, "shape": grid.shape, "columns": cols}
+
+
+def link_budget_chunks(distances, frequencies, bandwidths, chunk_size: int = SWEEP_CHUNK, **params):
+    """Balance de enlace sobre la rejilla d × f × B por bloques de índices planos (orden C).
+
+    Cada eje es una secuencia de valores o un SweepRange, que se evalúa solo en los índices de cada bloque.
+    """
+    axes = tuple(
+        a if isinstance(a, SweepRange) else np.asarray(a, dtype=np.float64).ravel()
+        for a in (distances, frequencies, bandwidths)
+    )
+    shape = tuple(len(a) for a in axes)
+    size = math.prod(shape)
+    for start in range(0, size, chunk_size):
+        coords = np.unravel_index(np.arange(start, min(start + chunk_size, size)), shape)
+        d, f, B = (a.at(c) if isinstance(a, SweepRange) else a[c] for a, c in zip(axes, coords))
+        cols = {"d": d, "f": f, "B": B, **link_budget(d, f, B, **params)}
+        cols["valid"] = np.isfinite(cols["capacity"])
+        yield start, cols
+
+
+# ---------- Derivación automática ----------
+@lru_cache(maxsize=256)
+def _derivation_plan(known: frozenset) -> tuple:
+    available = set(known)
+    plan = []
+    while True:
+        layer = {}
+        for record in REGISTRY:
+            if record.vector or not record.output or record.output in available:
+                continue
+            if record.output not in layer and all(f in available for f in record.fields):
+                layer[record.output] = record
+        if not layer:
+            return tuple(plan)
+        plan.extend(layer.values())
+        available.update(layer)
+
+
+def derivation_plan(known) -> list:
+    """Fórmulas a evaluar, en orden, para obtener todo lo derivable a partir de ``known``.
+
+    Se avanza por capas: cada magnitud se calcula una sola vez, con la primera fórmula del
+    catálogo que la alcanza en el menor número de pasos.
+    """
+    return [record.key for record in _derivation_plan(frozenset(known))]
+
+
+def derive(values: dict, formats=()) -> dict:
+    """Calcula todas las magnitudes derivables de ``values`` reutilizando los resultados intermedios.
+
+    Si algún valor es una lista o arreglo, la evaluación es por columnas (modo lote) y cada
+    magnitud incluye su máscara ``valid``.
+    """
+    batch = any(np.ndim(v) > 0 for v in values.values())
+    plan = _derivation_plan(frozenset(values))
+    known = as_columns(list(values), values) if batch else dict(values)
+    quantities = {}
+    for record in plan:
+        missing = [f for f in record.fields if f not in known]
+        if missing:
+            quantities[record.output] = {
+                "via": record.key,
+                "error": f"No se pudo obtener '{missing[0]}'",
             }
-    raise ValueError("Fórmula no encontrada")
+            continue
+        if batch:
+            result, unit, valid = evaluate_columns(record, {f: known[f] for f in record.fields})
+            entry = {"value": result, "unit": unit, "valid": valid, "via": record.key}
+            if formats:
+                parts = tuple(p for p in formats if p != "display")
+                entry["formats"] = format_many(result, unit, parts, display="display" in formats)
+        else:
+            try:
+                result, unit = record.fn(known)
+            except Exception as e:
+                quantities[record.output] = {"via": record.key, "error": str(e)}
+                continue
+            entry = {"value": result, "unit": unit, "via": record.key}
+            if formats:
+                entry["display"] = format_result(result, unit)
+        known[record.output] = result
+        quantities[record.output] = entry
+    return {"plan": [record.key for record in plan], "quantities": quantities}
+
+
+# ---------- Despeje inverso ----------
+# Intervalo de búsqueda por defecto: lineal para magnitudes en dB, logarítmico para el resto
+_DB_UNITS = ("dB", "dBi")
+_DB_BRACKET = (-400.0, 400.0)
+_LOG_BRACKET = (1e-30, 1e30)
+
+
+def _bracketed_root(residual, lo, hi, n: int, tol: float = 1e-13, max_iter: int = 200):
+    """Raíz vectorizada de ``residual`` en [lo, hi] por falsa posición (Illinois).
+
+    Trabaja en escala logarítmica si lo > 0 y devuelve NaN en las filas donde el residuo no
+    cambia de signo en el intervalo.
+    """
+    log = lo > 0
+    a = np.full(n, math.log10(lo) if log else lo)
+    b = np.full(n, math.log10(hi) if log else hi)
+    x = (lambda t: 10**t) if log else (lambda t: t)
+    fa, fb = residual(x(a)), residual(x(b))
+    ok = (np.sign(fa) * np.sign(fb) <= 0) & np.isfinite(fa) & np.isfinite(fb)
+    side = np.zeros(n, dtype=np.int8)
+    for _ in range(max_iter):
+        active = ok & (b - a > tol * np.maximum(1.0, np.abs(a))) & (fa != 0) & (fb != 0)
+        if not active.any():
+            break
+        c = (a * fb - b * fa) / (fb - fa)
+        # Si la secante se sale del intervalo (residuos no finitos o iguales) se biseca
+        c = np.where(np.isfinite(c) & (c > a) & (c < b), c, 0.5 * (a + b))
+        fc = residual(x(c))
+        fc = np.where(np.isnan(fc), fa, fc)
+        left = active & (np.sign(fc) == np.sign(fa))
+        right = active & ~left
+        # Illinois: si un extremo se conserva dos veces seguidas se reduce a la mitad su residuo
+        fb = np.where(left & (side == 1), 0.5 * fb, fb)
+        fa = np.where(right & (side == -1), 0.5 * fa, fa)
+        a, fa = np.where(left, c, a), np.where(left, fc, fa)
+        b, fb = np.where(right, c, b), np.where(right, fc, fb)
+        side = np.where(left, 1, np.where(right, -1, side)).astype(np.int8)
+    root = np.where(fa == 0, a, np.where(fb == 0, b, (a * fb - b * fa) / (fb - fa)))
+    root = np.where(np.isfinite(root) & (root >= a) & (root <= b), root, 0.5 * (a + b))
+    return np.where(ok, x(root), np.nan)
+
+
+def solve(formula_id: str, unknown: str, target, values: dict, bracket=None, formats=()) -> dict:
+    """Despeja ``unknown`` para que la fórmula dé ``target`` con el resto de campos en ``values``.
+
+    ``target`` y los valores admiten escalares o columnas. Usa el despeje analítico de la
+    fórmula si existe y, si no, falsa posición vectorizada (Illinois) en ``bracket`` (lineal para
+    campos en dB, logarítmica en [1e-30, 1e30] para los demás). Las filas sin solución se marcan
+    en ``valid``.
+    """
+    record = REGISTRY.get(formula_id)
+    if record.vector:
+        raise ValueError(f"La fórmula '{formula_id}' no admite despeje")
+    if unknown not in record.fields:
+        raise ValueError(f"'{unknown}' no es un campo de '{formula_id}'")
+    known = [f for f in record.fields if f != unknown]
+    cols = as_columns(known + ["__target__"], {**values, "__target__": target})
+    y = cols.pop("__target__")
+    n = len(y)
+    unit = record.units[record.fields.index(unknown)]
+
+    def forward(x):
+        return evaluate_columns(record, {**cols, unknown: np.broadcast_to(x, (n,))})[0]
+
+    with np.errstate(all="ignore"):
+        closed = record.inverse.get(unknown)
+        if closed is not None:
+            x = np.broadcast_to(np.asarray(closed(cols, y), dtype=np.float64), (n,))
+            method = "analytic"
+        else:
+            lo, hi = bracket or (_DB_BRACKET if unit in _DB_UNITS else _LOG_BRACKET)
+            if not lo < hi:
+                raise ValueError("El intervalo de búsqueda debe cumplir lo < hi")
+            x = _bracketed_root(lambda x: forward(x) - y, float(lo), float(hi), n)
+            method = "bracketed"
+        # Se comprueba cada despeje evaluando de nuevo la fórmula (dominio, raíces espurias)
+        valid = np.isfinite(x) & np.isclose(forward(x), y, rtol=1e-6, atol=0.0)
+    out = {"field": unknown, "value": np.array(x), "unit": unit, "valid": valid, "method": method}
+    if formats:
+        parts = tuple(p for p in formats if p != "display")
+        out["formats"] = format_many(out["value"], unit, parts, display="display" in formats)
+    return out
+
+
+# ---------- Propagación de incertidumbre (Monte Carlo) ----------
+MONTE_CARLO_CHUNK = 1 << 18
+
+# Clases de cada pasada de refinamiento de percentiles y máximo de muestras que se ordenan al final
+_MC_FINE_BINS = 4096
+_MC_EXACT_LIMIT = 1 << 16
+
+
+def _sampler(name: str, spec):
+    """Devuelve una función (rng, n) -> muestras para un campo."""
+    if isinstance(spec, (int, float)):
+        value = float(spec)
+        return lambda rng, n: np.full(n, value)
+    dist = spec.get("dist")
+    try:
+        if dist == "normal":
+            mean, std = float(spec["mean"]), float(spec["std"])
+            return lambda rng, n: rng.normal(mean, std, n)
+        if dist == "uniform":
+            low, high = float(spec["low"]), float(spec["high"])
+            return lambda rng, n: rng.uniform(low, high, n)
+        if dist == "empirical":
+            data = np.asarray(spec["samples"], dtype=np.float64)
+            if data.size == 0:
+                raise ValueError(f"'{name}': la distribución empírica necesita muestras")
+            return lambda rng, n: rng.choice(data, n)
+    except KeyError as e:
+        raise ValueError(f"'{name}': falta el parámetro {e.args[0]} de la distribución") from None
+    raise ValueError(f"'{name}': distribución desconocida '{dist}'")
+
+
+def monte_carlo_samplers(formula_id: str, distributions: dict) -> dict:
+    """Valida las distribuciones de entrada de ``formula_id`` y devuelve un muestreador por campo."""
+    record = REGISTRY.get(formula_id)
+    if record.vector:
+        raise ValueError(f"La fórmula '{formula_id}' no admite Monte Carlo")
+    for name in record.fields:
+        if name not in distributions:
+            raise MissingFieldError(name)
+    return {f: _sampler(f, distributions[f]) for f in record.fields}
+
+
+def monte_carlo_chunk(formula_id: str, distributions: dict, seed, n: int) -> np.ndarray:
+    """Resultados válidos de un bloque de ``n`` muestras; la misma semilla repite las mismas muestras."""
+    record = REGISTRY.get(formula_id)
+    samplers = monte_carlo_samplers(formula_id, distributions)
+    rng = np.random.default_rng(seed)
+    result, _unit, valid = evaluate_columns(record, {f: samplers[f](rng, n) for f in record.fields})
+    return result[valid]
+
+
+def _mc_moments(formula_id: str, distributions: dict, seed, n: int) -> tuple:
+    values = monte_carlo_chunk(formula_id, distributions, seed, n)
+    if not values.size:
+        return 0, 0.0, 0.0, math.inf, -math.inf
+    mean = float(values.mean())
+    return values.size, mean, float(((values - mean) ** 2).sum()), float(values.min()), float(values.max())
+
+
+def _mc_scan(formula_id: str, distributions: dict, seed, n: int, histogram=None, intervals=()) -> tuple:
+    """Histograma del bloque y, por intervalo (a, b, cerrado, ordenar), (mín, máx, muestras o clases)."""
+    values = monte_carlo_chunk(formula_id, distributions, seed, n)
+    counts = np.histogram(values, bins=histogram[0], range=histogram[1])[0] if histogram else None
+    found = []
+    for a, b, closed, gather in intervals:
+        inside = values[(values >= a) & ((values <= b) if closed else (values < b))]
+        if not inside.size:
+            found.append(None)
+            continue
+        part = inside if gather else np.histogram(inside, bins=_MC_FINE_BINS, range=(a, b))[0]
+        found.append((float(inside.min()), float(inside.max()), part))
+    return counts, found
+
+
+def _mc_map(fn, formula_id, distributions, samples, chunk_size, seeds, extra=(), pool=None, window=2):
+    """Genera (resultado, muestras) de ``fn`` por bloque en orden, aquí o en ``pool`` con ``window`` en vuelo."""
+    tasks = (
+        (formula_id, distributions, seeds[i], min(chunk_size, samples - start), *extra)
+        for i, start in enumerate(range(0, samples, chunk_size))
+    )
+    if pool is None:
+        for args in tasks:
+            yield fn(*args), args[3]
+        return
+    pending = deque()
+    try:
+        for args in tasks:
+            pending.append((pool.submit(fn, *args), args[3]))
+            if len(pending) >= window:
+                fut, n = pending.popleft()
+                yield fut.result(), n
+        while pending:
+            fut, n = pending.popleft()
+            yield fut.result(), n
+    finally:
+        for fut, _n in pending:
+            fut.cancel()
+
+
+def monte_carlo(
+    formula_id: str,
+    distributions: dict,
+    samples: int = 100_000,
+    percentiles=(5, 50, 95),
+    bins: int = None,
+    seed: int = None,
+    chunk_size: int = MONTE_CARLO_CHUNK,
+    on_progress=None,
+    cancel=None,
+    pool=None,
+    window: int = 2,
+) -> dict:
+    """Propaga distribuciones de entrada a través de una fórmula por muestreo.
+
+    Cada campo es un número fijo o ``{"dist": "normal", "mean", "std"}``,
+    ``{"dist": "uniform", "low", "high"}`` o ``{"dist": "empirical", "samples": [...]}``.
+    Las muestras se generan por bloques: media y desviación se acumulan en una pasada y el
+    histograma y los percentiles en pasadas siguientes que regeneran los mismos bloques, así
+    que la memoria no depende de ``samples``. Los percentiles son exactos (mismo criterio que
+    ``np.percentile``): cada pasada divide en 4096 clases el intervalo que contiene cada rango
+    buscado hasta que quedan pocas muestras, y esas se ordenan; con colas pesadas solo hace
+    falta alguna pasada más. Con ``pool`` (un Executor de procesos) los bloques se evalúan allí,
+    como mucho ``window`` a la vez y combinados en orden, con el mismo resultado. Si se activa
+    el evento ``cancel`` devuelve None.
+    """
+    monte_carlo_samplers(formula_id, distributions)
+    record = REGISTRY.get(formula_id)
+    if samples < 1:
+        raise ValueError("El número de muestras debe ser positivo")
+    if not all(0 <= p <= 100 for p in percentiles):
+        raise ValueError("Los percentiles deben estar entre 0 y 100")
+    seq = np.random.SeedSequence(seed)
+    seeds = seq.spawn(-(-samples // chunk_size))
+    # Pasadas previstas: momentos, histograma y ordenación final (las de refinamiento extra no cuentan)
+    passes = 3 if percentiles else 2 if bins else 1
+    done = 0
+
+    def cancelled():
+        return cancel is not None and cancel.is_set()
+
+    def run(fn, *extra):
+        nonlocal done
+        for res, n in _mc_map(fn, formula_id, distributions, samples, chunk_size, seeds, extra, pool, window):
+            yield res
+            done += n
+            if on_progress is not None:
+                on_progress(min(done / (samples * passes), 0.99))
+            if cancelled():
+                return
+
+    def scan(intervals, histogram=None):
+        """Una pasada de _mc_scan combinada: (histograma, acumulado por intervalo)."""
+        counts = np.zeros(histogram[0], dtype=np.int64) if histogram else None
+        accs = [{"min": math.inf, "max": -math.inf, "parts": [] if gather else None,
+                 "counts": None if gather else np.zeros(_MC_FINE_BINS, np.int64)}
+                for _a, _b, _closed, gather in intervals]
+        for c_counts, found in run(_mc_scan, histogram, intervals):
+            if counts is not None:
+                counts += c_counts
+            for acc, item in zip(accs, found):
+                if item is None:
+                    continue
+                c_min, c_max, part = item
+                acc["min"], acc["max"] = min(acc["min"], c_min), max(acc["max"], c_max)
+                if acc["parts"] is not None:
+                    acc["parts"].append(part)
+                else:
+                    acc["counts"] += part
+        return counts, accs
+
+    count, mean, m2 = 0, 0.0, 0.0
+    lo, hi = math.inf, -math.inf
+    for c_count, c_mean, c_m2, c_lo, c_hi in run(_mc_moments):
+        if c_count:
+            # Combinación de medias y momentos por bloques (Chan et al.)
+            total = count + c_count
+            delta = c_mean - mean
+            mean += delta * c_count / total
+            m2 += c_m2 + delta * delta * count * c_count / total
+            count = total
+            lo, hi = min(lo, c_lo), max(hi, c_hi)
+    if cancelled():
+        return None
+
+    out = {
+        "unit": record.unit,
+        "samples": samples,
+        "valid": count,
+        "invalid": samples - count,
+        "mean": mean if count else None,
+        "std": math.sqrt(m2 / (count - 1)) if count > 1 else None,
+        "min": lo if count else None,
+        "max": hi if count else None,
+        "seed": seq.entropy,
+    }
+    if passes == 1 or not count:
+        out["percentiles"] = {str(p): None for p in percentiles} if percentiles else {}
+        return out
+
+    span = (lo, hi) if hi > lo else (lo - 0.5, hi + 0.5)
+    histogram = (bins, span) if bins else None
+    counts, values_at = None, {}
+    if percentiles and hi > lo:
+        # Interpolación lineal entre los estadísticos de orden k y k+1, como np.percentile
+        ranks = {r for p in percentiles for r in _percentile_ranks(p, count)}
+        found = _order_statistics(scan, sorted(ranks), lo, hi, count, histogram, cancelled)
+        if found is None:
+            return None
+        counts, values_at = found
+    elif histogram:
+        counts, _ = scan((), histogram)
+    if cancelled():
+        return None
+    out["percentiles"] = {}
+    for p in percentiles:
+        if hi == lo:
+            out["percentiles"][str(p)] = lo
+            continue
+        k, k1 = _percentile_ranks(p, count)
+        h = (count - 1) * p / 100
+        out["percentiles"][str(p)] = float(values_at[k] + (h - k) * (values_at[k1] - values_at[k]))
+    if counts is not None:
+        out["histogram"] = {"edges": np.linspace(span[0], span[1], bins + 1).tolist(), "counts": counts.tolist()}
+    return out
+
+
+def _percentile_ranks(p: float, count: int) -> tuple:
+    k = math.floor((count - 1) * p / 100)
+    return k, min(k + 1, count - 1)
+
+
+def _order_statistics(scan, ranks, lo: float, hi: float, count: int, histogram=None, cancelled=None):
+    """Valores exactos de los estadísticos de orden ``ranks`` (base 0) con pasadas de ``scan``.
+
+    Cada intervalo pendiente guarda cuántas muestras quedan por debajo y cuántas contiene; se
+    divide en _MC_FINE_BINS clases hasta que contiene como mucho _MC_EXACT_LIMIT muestras, que
+    entonces se ordenan. El ``histogram`` pedido se acumula en la primera pasada. Devuelve
+    (histograma, {rango: valor}) o None si ``cancelled()`` se cumple al terminar una pasada.
+    """
+    found, counts = {}, None
+    # (a, b, cerrado por arriba) -> [muestras por debajo, muestras dentro, rangos buscados]
+    pending = {(lo, hi, True): [0, count, list(ranks)]}
+    while pending:
+        keys = list(pending)
+        intervals = []
+        for a, b, closed in keys:
+            # Intervalo ya del orden de la resolución de float64: se ordena aunque sea grande
+            gather = pending[(a, b, closed)][1] <= _MC_EXACT_LIMIT or not np.all(
+                np.diff(np.linspace(a, b, _MC_FINE_BINS + 1)) > 0
+            )
+            intervals.append((a, b, closed, gather))
+        pass_counts, accs = scan(intervals, histogram)
+        if cancelled is not None and cancelled():
+            return None
+        if histogram:
+            counts, histogram = pass_counts, None
+        refined = {}
+        for key, acc in zip(keys, accs):
+            below, _inside, wanted = pending[key]
+            if acc["min"] == acc["max"]:
+                # Todas las muestras del intervalo son iguales
+                found.update(dict.fromkeys(wanted, acc["min"]))
+                continue
+            if acc["parts"] is not None:
+                ordered = np.sort(np.concatenate(acc["parts"]))
+                found.update({r: float(ordered[r - below]) for r in wanted})
+                continue
+            edges, cum = np.linspace(key[0], key[1], _MC_FINE_BINS + 1), np.cumsum(acc["counts"])
+            for r in wanted:
+                j = int(np.searchsorted(cum, r - below, side="right"))
+                before = int(cum[j - 1]) if j else 0
+                sub = (float(edges[j]), float(edges[j + 1]), key[2] and j == _MC_FINE_BINS - 1)
+                refined.setdefault(sub, [below + before, int(acc["counts"][j]), []])[2].append(r)
+        pending = refined
+    return counts, found
+
+
+if __name__ == "__main__":
+    import sys
 
+    from consola import main
 
+    sys.exit(main())
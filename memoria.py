@@ -0,0 +1,258 @@
+"""Depuración de memoria con tracemalloc: instantáneas con nombre, diferencias, sitios de asignación y picos por petición.
+
+Solo mide el proceso de la API: los trabajos que se ejecutan en otros procesos (JOBS_PROCESSES)
+no aparecen aquí.
+"""
+
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+
+import numpy as np
+
+from metricas import current_request, formula_label
+
+# Instantáneas con nombre que se conservan (las más antiguas se descartan)
+MAX_SNAPSHOTS = 8
+
+# Peticiones recientes con pico medido que se conservan
+MAX_REQUESTS = 500
+
+# Rutas cuyo pico de memoria se mide por petición (prefijos de la ruta de la URL)
+HEAVY_PATHS = ("/calculate/batch", "/sweep", "/link-budget", "/montecarlo", "/jobs/")
+
+# Asignaciones del propio trazado que no interesan en los informes
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_REQUEST = ContextVar("calc_memory_request", default=None)
+
+
+def note_items(n: int):
+    """Anota el tamaño de entrada (filas, puntos, muestras) de la petición en curso."""
+    entry = _REQUEST.get()
+    if entry is not None:
+        entry["items"] = int(n)
+
+
+def _stat(stat, group_by: str) -> dict:
+    frames = [{"file": f.filename, "line": f.lineno} for f in stat.traceback]
+    out = {"size": stat.size, "count": stat.count, "where": frames[0] if group_by != "traceback" else frames}
+    if hasattr(stat, "size_diff"):
+        out["size_diff"] = stat.size_diff
+        out["count_diff"] = stat.count_diff
+    return out
+
+
+class MemoryTracer:
+    """Control de tracemalloc y registro de picos por petición; seguro entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()
+        self._requests = deque(maxlen=MAX_REQUESTS)
+        self._inflight = []
+
+    # ---------- Control ----------
+    @property
+    def running(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10):
+        """Activa tracemalloc guardando ``frames`` marcos por asignación; descarta lo recogido antes."""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+            self._requests.clear()
+        tracemalloc.start(frames)
+
+    def stop(self):
+        """Desactiva tracemalloc; las instantáneas y los picos ya medidos se conservan."""
+        tracemalloc.stop()
+
+    def status(self) -> dict:
+        out = {"running": self.running}
+        if self.running:
+            current, peak = tracemalloc.get_traced_memory()
+            out.update(
+                frames=tracemalloc.get_traceback_limit(),
+                current=current,
+                peak=peak,
+                overhead=tracemalloc.get_tracemalloc_memory(),
+            )
+        with self._lock:
+            out["snapshots"] = [
+                {"name": name, "taken": taken, "size": size} for name, (_, taken, size) in self._snapshots.items()
+            ]
+        out["routes"] = self.summary()
+        return out
+
+    # ---------- Instantáneas ----------
+    def snapshot(self, name: str = None) -> dict:
+        """Toma una instantánea y la guarda como ``name`` (por defecto, un nombre correlativo)."""
+        if not self.running:
+            raise RuntimeError("tracemalloc no está activo; usa start() primero")
+        snap = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        size = sum(t.size for t in snap.traces)
+        taken = time.time()
+        with self._lock:
+            name = name or f"s{len(self._snapshots) + 1}"
+            while name in self._snapshots:
+                name += "'"
+            self._snapshots[name] = (snap, taken, size)
+            while len(self._snapshots) > MAX_SNAPSHOTS:
+                self._snapshots.popitem(last=False)
+        return {"name": name, "taken": taken, "size": size}
+
+    def _get(self, name: str):
+        with self._lock:
+            if name not in self._snapshots:
+                raise KeyError(f"No existe la instantánea '{name}'")
+            return self._snapshots[name][0]
+
+    def _current(self, name: str = None):
+        if name is not None:
+            return self._get(name)
+        if not self.running:
+            raise RuntimeError("tracemalloc no está activo; indica una instantánea guardada")
+        return tracemalloc.take_snapshot().filter_traces(_IGNORED)
+
+    def top(self, name: str = None, limit: int = 20, group_by: str = "lineno") -> dict:
+        """Sitios con más memoria viva en la instantánea ``name`` (o en este momento)."""
+        stats = self._current(name).statistics(group_by)
+        return {
+            "total": sum(s.size for s in stats),
+            "group_by": group_by,
+            "top": [_stat(s, group_by) for s in stats[:limit]],
+        }
+
+    def diff(self, base: str, target: str = None, limit: int = 20, group_by: str = "lineno") -> dict:
+        """Crecimiento de ``base`` a ``target`` (o a este momento) por sitio de asignación."""
+        old = self._get(base)
+        stats = self._current(target).compare_to(old, group_by)
+        return {
+            "size_diff": sum(s.size_diff for s in stats),
+            "group_by": group_by,
+            "top": [_stat(s, group_by) for s in stats[:limit]],
+        }
+
+    # ---------- Picos por petición ----------
+    def enter(self, scope) -> dict:
+        """Empieza a medir una petición; el pico de tracemalloc es global, así que las solapadas se marcan."""
+        with self._lock:
+            if not self._inflight:
+                tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            entry = {
+                "baseline": current,
+                "overlapped": bool(self._inflight),
+                "items": None,
+                "start": time.perf_counter(),
+            }
+            for other in self._inflight:
+                other["overlapped"] = True
+            self._inflight.append(entry)
+        return entry
+
+    def exit(self, scope, entry: dict, status: int):
+        if not self.running:
+            with self._lock:
+                self._inflight.remove(entry)
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        seconds = time.perf_counter() - entry["start"]
+        request = current_request()
+        route = getattr(scope.get("route"), "path", None) or "unmatched"
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        record = {
+            "route": route,
+            "formula_id": formula_label(request["formula_id"]) if request is not None else "",
+            "stream": query.get("stream", [None])[0],
+            "status": status,
+            "items": entry["items"],
+            # Con peticiones solapadas el pico puede ser de otra, o anterior a esta: es una cota superior
+            "peak": max(0, peak - entry["baseline"]),
+            "retained": current - entry["baseline"],
+            "overlapped": entry["overlapped"],
+            "seconds": seconds,
+        }
+        with self._lock:
+            self._inflight.remove(entry)
+            self._requests.append(record)
+
+    def requests(self, route: str = None) -> list:
+        with self._lock:
+            return [r for r in self._requests if route is None or r["route"] == route]
+
+    def summary(self) -> list:
+        """Picos por (ruta, fórmula, stream) y pendiente bytes/elemento del pico frente al tamaño de entrada.
+
+        Una pendiente próxima a cero al crecer ``items`` indica memoria constante.
+        """
+        groups = {}
+        for r in self.requests():
+            groups.setdefault((r["route"], r["formula_id"], r["stream"]), []).append(r)
+        out = []
+        for (route, formula_id, stream), records in sorted(groups.items(), key=lambda kv: tuple(map(str, kv[0]))):
+            peaks = [r["peak"] for r in records]
+            entry = {
+                "route": route,
+                "formula_id": formula_id,
+                "stream": stream,
+                "requests": len(records),
+                "overlapped": sum(r["overlapped"] for r in records),
+                "peak_max": max(peaks),
+                "peak_last": peaks[-1],
+            }
+            sized = [(r["items"], r["peak"]) for r in records if r["items"] and not r["overlapped"]]
+            if len({n for n, _ in sized}) >= 2:
+                items, sized_peaks = np.array(sized, dtype=np.float64).T
+                slope, intercept = np.polyfit(items, sized_peaks, 1)
+                entry["bytes_per_item"] = float(slope)
+                entry["fixed_bytes"] = float(intercept)
+                entry["items_range"] = [int(items.min()), int(items.max())]
+            out.append(entry)
+        return out
+
+
+TRACER = MemoryTracer()
+
+
+class MemoryMiddleware:
+    """Middleware ASGI que mide el pico de memoria de las peticiones pesadas mientras tracemalloc está activo.
+
+    Debe quedar dentro de MetricsMiddleware para conocer la fórmula de cada petición.
+    """
+
+    def __init__(self, app, tracer: MemoryTracer = TRACER, paths=HEAVY_PATHS):
+        self.app = app
+        self.tracer = tracer
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths) or not self.tracer.running:
+            await self.app(scope, receive, send)
+            return
+        entry = self.tracer.enter(scope)
+        token = _REQUEST.set(entry)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _REQUEST.reset(token)
+            self.tracer.exit(scope, entry, status)
@@ -0,0 +1,243 @@
+"""Métricas de la API: recuentos, errores por causa e histogramas de latencia por fase en formato Prometheus."""
+
+import asyncio
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from formulas import REGISTRY, MissingFieldError, UnknownFormulaError
+
+# Límites superiores de los cubos de latencia en segundos (el último cubo es +Inf)
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+PHASES = ("validation", "compute", "format", "total")
+
+# Causa de error según el código HTTP cuando el manejador no ha registrado una más precisa
+_STATUS_CAUSES = {404: "not_found", 409: "conflict", 413: "too_large", 422: "validation", 429: "queue_full"}
+
+# Estado de la petición en curso (lo crea el middleware; los manejadores lo completan)
+_CURRENT = ContextVar("calc_metrics_request", default=None)
+
+
+class _Histogram:
+    """Cubos preasignados de un histograma acumulable; observe() no crea objetos."""
+
+    __slots__ = ("counts", "total")
+
+    def __init__(self, buckets: int):
+        self.counts = array("q", bytes(8 * (buckets + 1)))
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+
+
+class Metrics:
+    """Contadores e histogramas por (endpoint, fórmula); seguro entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._errors = {}
+        self._latency = {}
+
+    def observe(self, endpoint: str, formula_id: str, phase: str, seconds: float):
+        key = (endpoint, formula_id, phase)
+        with self._lock:
+            hist = self._latency.get(key)
+            if hist is None:
+                hist = self._latency[key] = _Histogram(len(LATENCY_BUCKETS))
+            hist.observe(seconds)
+
+    def count_request(self, endpoint: str, formula_id: str, status: int):
+        key = (endpoint, formula_id, str(status))
+        with self._lock:
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def count_error(self, endpoint: str, formula_id: str, cause: str):
+        key = (endpoint, formula_id, cause)
+        with self._lock:
+            self._errors[key] = self._errors.get(key, 0) + 1
+
+    def render(self) -> str:
+        """Exposición en formato de texto de Prometheus (versión 0.0.4)."""
+        with self._lock:
+            requests = sorted(self._requests.items())
+            errors = sorted(self._errors.items())
+            latency = sorted((k, (list(h.counts), h.total)) for k, h in self._latency.items())
+        lines = [
+            "# HELP calc_requests_total Peticiones atendidas por endpoint, fórmula y código HTTP.",
+            "# TYPE calc_requests_total counter",
+        ]
+        for (endpoint, formula_id, status), n in requests:
+            lines.append(f'calc_requests_total{{endpoint="{endpoint}",formula_id="{formula_id}",status="{status}"}} {n}')
+        lines += [
+            "# HELP calc_errors_total Errores por endpoint, fórmula y causa.",
+            "# TYPE calc_errors_total counter",
+        ]
+        for (endpoint, formula_id, cause), n in errors:
+            lines.append(f'calc_errors_total{{endpoint="{endpoint}",formula_id="{formula_id}",cause="{cause}"}} {n}')
+        lines += [
+            "# HELP calc_latency_seconds Latencia por fase (validation, compute, format) y total.",
+            "# TYPE calc_latency_seconds histogram",
+        ]
+        for (endpoint, formula_id, phase), (counts, total) in latency:
+            labels = f'endpoint="{endpoint}",formula_id="{formula_id}",phase="{phase}"'
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, counts):
+                cumulative += n
+                lines.append(f'calc_latency_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'calc_latency_seconds_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f"calc_latency_seconds_sum{{{labels}}} {total!r}")
+            lines.append(f"calc_latency_seconds_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def error_cause(exc: BaseException) -> str:
+    """Causa de un error de cálculo para la etiqueta ``cause``."""
+    if isinstance(exc, UnknownFormulaError):
+        return "unknown_formula"
+    if isinstance(exc, ZeroDivisionError):
+        return "division_by_zero"
+    if isinstance(exc, (KeyError, MissingFieldError)):
+        return "missing_field"
+    if isinstance(exc, OverflowError):
+        return "overflow"
+    if isinstance(exc, ValueError) and "math domain error" in str(exc):
+        return "domain"
+    if isinstance(exc, (ValueError, TypeError)):
+        return "invalid_input"
+    return "internal"
+
+
+def formula_label(formula_id) -> str:
+    """Etiqueta de fórmula: solo ids del catálogo, para que un id arbitrario no cree series nuevas."""
+    return formula_id if formula_id in REGISTRY else ("unknown" if formula_id else "")
+
+
+def record_error(exc: BaseException):
+    """Anota la causa del error de la petición en curso."""
+    current = _CURRENT.get()
+    if current is not None:
+        current["cause"] = error_cause(exc)
+
+
+def add_phase(name: str, seconds: float):
+    """Suma ``seconds`` a la fase ``name`` de la petición en curso (para tiempos medidos en otro sitio)."""
+    current = _CURRENT.get()
+    if current is not None:
+        current["phases"][name] = current["phases"].get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name: str):
+    """Mide un bloque como fase ``name`` de la petición en curso."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - started)
+
+
+def current_request():
+    """Estado de métricas de la petición en curso o None fuera de una petición."""
+    return _CURRENT.get()
+
+
+def run_tagged(fn, *args, **kwargs):
+    """Ejecuta ``fn`` anotando el hilo actual como el que atiende la petición en curso (ver perfilado)."""
+    current = _CURRENT.get()
+    if current is None:
+        return fn(*args, **kwargs)
+    previous, current["worker"] = current["worker"], threading.get_ident()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        current["worker"] = previous
+
+
+def instrumented(endpoint):
+    """Marca el fin de la validación (el manejador empieza) y la fórmula de la petición."""
+
+    def enter(kwargs):
+        current = _CURRENT.get()
+        if current is not None:
+            current["handler"] = time.perf_counter()
+            payload = kwargs.get("payload")
+            current["formula_id"] = getattr(payload, "formula_id", None)
+
+    if asyncio.iscoroutinefunction(endpoint):
+        @wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            enter(kwargs)
+            return await endpoint(*args, **kwargs)
+    else:
+        @wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            enter(kwargs)
+            return run_tagged(endpoint, *args, **kwargs)
+    return wrapper
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que registra cada petición al terminar de enviar la respuesta."""
+
+    def __init__(self, app, metrics: Metrics = METRICS, exclude=("/metrics",)):
+        self.app = app
+        self.metrics = metrics
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+        current = {
+            "start": time.perf_counter(),
+            "handler": None,
+            "formula_id": None,
+            "cause": None,
+            "phases": {},
+            "worker": None,
+        }
+        token = _CURRENT.set(current)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _CURRENT.reset(token)
+            self._record(scope, current, status)
+
+    def _record(self, scope, current, status: int):
+        route = scope.get("route")
+        endpoint = getattr(route, "path", None) or "unmatched"
+        formula_id = formula_label(current["formula_id"])
+        now = time.perf_counter()
+        m = self.metrics
+        m.count_request(endpoint, formula_id, status)
+        m.observe(endpoint, formula_id, "total", now - current["start"])
+        if current["handler"] is not None:
+            m.observe(endpoint, formula_id, "validation", current["handler"] - current["start"])
+        for name, seconds in current["phases"].items():
+            m.observe(endpoint, formula_id, name, seconds)
+        if status >= 400:
+            cause = current["cause"] or _STATUS_CAUSES.get(status, "internal" if status >= 500 else "bad_request")
+            m.count_error(endpoint, formula_id, cause)
@@ -0,0 +1,317 @@
+"""Selección y orden de etapas que minimiza el ruido en cascada (Friis) con ramificación y poda."""
+
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Callable, Optional
+
+from paralelo import attach
+
+# Cada cuántos nodos se consulta el reloj y la mejor solución compartida
+_CHECK_EVERY = 1024
+
+
+@dataclass(frozen=True, slots=True)
+class Stage:
+    """Etapa disponible: ganancia y factor de ruido en unidades lineales."""
+
+    name: str
+    gain: float
+    noise_factor: float
+
+    @classmethod
+    def from_any(cls, item, index: int = 0) -> "Stage":
+        if isinstance(item, Stage):
+            return item
+        if isinstance(item, dict):
+            return cls(str(item.get("name", f"etapa {index + 1}")), float(item["gain"]), float(item["noise_factor"]))
+        gain, noise_factor, *name = item
+        return cls(str(name[0]) if name else f"etapa {index + 1}", float(gain), float(noise_factor))
+
+    @property
+    def noise_measure(self) -> float:
+        """Medida de ruido M = (F − 1)/(1 − 1/G); ordenar por M ascendente es óptimo con G > 1."""
+        if self.gain <= 1:
+            return math.inf
+        return (self.noise_factor - 1) / (1 - 1 / self.gain)
+
+
+@dataclass(slots=True)
+class ChainResult:
+    """Mejor cadena encontrada; ``optimal`` es False si se agotó el tiempo antes de terminar."""
+
+    order: tuple
+    names: tuple
+    noise_factor: float
+    noise_figure_db: float
+    gain: float
+    optimal: bool
+    nodes: int
+    elapsed: float
+
+    def as_dict(self) -> dict:
+        return {
+            "order": list(self.order),
+            "names": list(self.names),
+            "noise_factor": self.noise_factor,
+            "noise_figure_db": self.noise_figure_db,
+            "gain": self.gain,
+            "optimal": self.optimal,
+            "nodes": self.nodes,
+            "elapsed": self.elapsed,
+        }
+
+
+class _Timeout(Exception):
+    pass
+
+
+def _chain_value(stages, order):
+    """(factor de ruido, ganancia) de una cadena dada como índices."""
+    total, gain = 1.0, 1.0
+    for j in order:
+        g, f = stages[j]
+        total += (f - 1) / gain
+        gain *= g
+    return total, gain
+
+
+def _search_task(stages, prefix, min_gain, max_stages, deadline, best_f, stop=None, bound=None):
+    """Búsqueda en profundidad de todas las cadenas que empiezan por ``prefix``.
+
+    ``stop`` es un evento que interrumpe la búsqueda. ``bound`` es el nombre de un bloque de memoria
+    compartida con dos float64, la mejor F global y el aviso de parada, que usan las tareas en un pool.
+    Devuelve (mejor F, mejor orden, nodos visitados, búsqueda completa).
+    """
+    if bound is None:
+        return _search(stages, prefix, min_gain, max_stages, deadline, best_f, stop, None)
+    shm = attach(bound)
+    shared = shm.buf.cast("d")
+    try:
+        return _search(stages, prefix, min_gain, max_stages, deadline, best_f, stop, shared)
+    finally:
+        shared.release()
+        shm.close()
+
+
+def _search(stages, prefix, min_gain, max_stages, deadline, best_f, stop, shared):
+    n = len(stages)
+    gains = [g for g, _ in stages]
+    excess = [f - 1 for _, f in stages]
+    min_excess = min(excess)
+    by_measure = sorted(
+        range(n), key=lambda j: (excess[j] / (1 - 1 / gains[j])) if gains[j] > 1 else math.inf
+    )
+    if shared is not None:
+        best_f = min(best_f, shared[0])
+
+    path = list(prefix)
+    used = [False] * n
+    for j in prefix:
+        used[j] = True
+    state = {"best_f": best_f, "best_order": None, "nodes": 0}
+
+    def stopped():
+        return (stop is not None and stop.is_set()) or (shared is not None and shared[1])
+
+    def publish(value):
+        # Sin cerrojo: una carrera solo puede dejar una cota peor pero alcanzable, nunca una inválida
+        if shared is not None and value < shared[0]:
+            shared[0] = value
+
+    def visit(f_part, g_cum):
+        state["nodes"] += 1
+        if state["nodes"] % _CHECK_EVERY == 0:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise _Timeout
+            if stopped():
+                raise _Timeout
+            if shared is not None and shared[0] < state["best_f"]:
+                state["best_f"] = shared[0]
+        if path and g_cum >= min_gain:
+            # Con F >= 1 añadir etapas nunca reduce el ruido: la rama termina aquí
+            if f_part < state["best_f"]:
+                state["best_f"] = f_part
+                state["best_order"] = tuple(path)
+                publish(f_part)
+            return
+        if len(path) >= max_stages:
+            return
+        reachable = g_cum
+        for j in range(n):
+            if not used[j] and gains[j] > 1:
+                reachable *= gains[j]
+        if reachable < min_gain:
+            return
+        for j in by_measure:
+            if used[j]:
+                continue
+            f_new = f_part + excess[j] / g_cum
+            g_new = g_cum * gains[j]
+            bound = f_new if g_new >= min_gain else f_new + min_excess / g_new
+            if bound >= state["best_f"]:
+                continue
+            used[j] = True
+            path.append(j)
+            visit(f_new, g_new)
+            path.pop()
+            used[j] = False
+
+    if (deadline is not None and time.monotonic() >= deadline) or stopped():
+        return state["best_f"], None, 0, False
+    f_part, g_cum = _chain_value(stages, prefix)
+    try:
+        visit(f_part, g_cum)
+        complete = True
+    except _Timeout:
+        complete = False
+    return state["best_f"], state["best_order"], state["nodes"], complete
+
+
+def _greedy(stage_list, min_gain, max_stages):
+    """Solución inicial: etapas por medida de ruido hasta alcanzar la ganancia mínima."""
+    order, gain = [], 1.0
+    for j in sorted(range(len(stage_list)), key=lambda j: stage_list[j].noise_measure):
+        if len(order) >= max_stages:
+            break
+        order.append(j)
+        gain *= stage_list[j].gain
+        if gain >= min_gain:
+            return tuple(order)
+    return None
+
+
+def _prefixes(n, depth, max_stages):
+    """Prefijos de longitud ``depth`` (sin repetir etapas) que reparten el trabajo."""
+    level = [()]
+    for _ in range(min(depth, max_stages)):
+        level = [p + (j,) for p in level for j in range(n) if j not in p]
+    return level
+
+
+def prepare_stages(stages, min_gain: float = 1.0, max_stages: Optional[int] = None) -> tuple:
+    """Valida las etapas y que alguna cadena pueda alcanzar ``min_gain``; devuelve (etapas, máximo de etapas)."""
+    stage_list = [Stage.from_any(s, i) for i, s in enumerate(stages)]
+    if not stage_list:
+        raise ValueError("Se necesita al menos una etapa")
+    for s in stage_list:
+        if s.gain <= 0 or s.noise_factor < 1:
+            raise ValueError(f"Etapa '{s.name}' no válida: se requiere G > 0 y F >= 1")
+    n = len(stage_list)
+    max_stages = n if max_stages is None else max(1, min(int(max_stages), n))
+    top_gains = sorted((s.gain for s in stage_list), reverse=True)[:max_stages]
+    reachable = math.prod(g for g in top_gains if g > 1) if top_gains[0] > 1 else top_gains[0]
+    if reachable < min_gain:
+        raise ValueError("Ninguna combinación de etapas alcanza la ganancia mínima")
+    return stage_list, max_stages
+
+
+def optimize_chain(
+    stages,
+    min_gain: float = 1.0,
+    max_stages: Optional[int] = None,
+    time_budget: Optional[float] = None,
+    workers: Optional[int] = None,
+    on_progress: Optional[Callable[[dict], None]] = None,
+    progress_interval: float = 0.5,
+    cancel: Optional[threading.Event] = None,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> ChainResult:
+    """Busca el subconjunto ordenado de etapas con menor factor de ruido total y ganancia >= ``min_gain``.
+
+    La búsqueda se reparte por prefijos entre ``workers`` procesos (como mucho, los núcleos de la
+    máquina) que comparten la mejor cota; con ``pool`` se usa ese pool en lugar de crear uno propio.
+    Con ``time_budget`` (segundos) devuelve la mejor cadena hallada hasta ese momento;
+    ``on_progress`` recibe informes periódicos con la mejor solución parcial y ``cancel``
+    detiene la búsqueda devolviendo lo mejor encontrado hasta entonces.
+    """
+    started = time.monotonic()
+    stage_list, max_stages = prepare_stages(stages, min_gain, max_stages)
+    n = len(stage_list)
+    raw = tuple((s.gain, s.noise_factor) for s in stage_list)
+    deadline = None if time_budget is None else started + time_budget
+    cpus = os.cpu_count() or 1
+    workers = min(workers or cpus, cpus)
+
+    best_f, best_order = math.inf, None
+    greedy = _greedy(stage_list, min_gain, max_stages)
+    if greedy is not None:
+        best_f, best_order = _chain_value(raw, greedy)[0], greedy
+
+    nodes, complete = 0, True
+
+    def report(tasks_done, tasks_total, current):
+        if on_progress is not None:
+            on_progress(
+                {
+                    "best_noise_factor": current,
+                    "best_noise_figure_db": 10 * math.log10(current) if math.isfinite(current) else None,
+                    "tasks_done": tasks_done,
+                    "tasks_total": tasks_total,
+                    "nodes": nodes,
+                    "elapsed": time.monotonic() - started,
+                }
+            )
+
+    if workers <= 1 or n <= 3:
+        best_f_task, order, nodes, complete = _search_task(
+            raw, (), min_gain, max_stages, deadline, best_f, cancel
+        )
+        if order is not None and best_f_task < best_f:
+            best_f, best_order = best_f_task, order
+        report(1, 1, best_f)
+    else:
+        depth = 1 if n >= 4 * workers else 2
+        # Los prefijos más cortos que el reparto también son cadenas candidatas
+        for short in _prefixes(n, depth - 1, max_stages) if depth > 1 else ():
+            f, g = _chain_value(raw, short)
+            if g >= min_gain and f < best_f:
+                best_f, best_order = f, short
+        tasks = _prefixes(n, depth, max_stages)
+        block = shared_memory.SharedMemory(create=True, size=16)
+        shared = block.buf.cast("d")
+        shared[0], shared[1] = best_f, 0.0
+        executor = pool or ProcessPoolExecutor(max_workers=workers)
+        try:
+            pending = {
+                executor.submit(_search_task, raw, prefix, min_gain, max_stages, deadline, best_f, None, block.name)
+                for prefix in tasks
+            }
+            done_count = 0
+            while pending:
+                if cancel is not None and cancel.is_set():
+                    shared[1] = 1.0
+                done, pending = wait(pending, timeout=progress_interval, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    f, order, task_nodes, task_complete = fut.result()
+                    nodes += task_nodes
+                    complete = complete and task_complete
+                    done_count += 1
+                    if order is not None and f < best_f:
+                        best_f, best_order = f, order
+                report(done_count, len(tasks), min(best_f, shared[0]))
+        finally:
+            shared[1] = 1.0
+            if executor is not pool:
+                executor.shutdown(cancel_futures=True)
+            shared.release()
+            block.close()
+            block.unlink()
+
+    if best_order is None:
+        raise ValueError("Ninguna combinación de etapas alcanza la ganancia mínima")
+    noise_factor, gain = _chain_value(raw, best_order)
+    return ChainResult(
+        order=best_order,
+        names=tuple(stage_list[j].name for j in best_order),
+        noise_factor=noise_factor,
+        noise_figure_db=10 * math.log10(noise_factor),
+        gain=gain,
+        optimal=complete,
+        nodes=nodes,
+        elapsed=time.monotonic() - started,
+    )
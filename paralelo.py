@@ -0,0 +1,114 @@
+"""Evaluación multinúcleo de columnas grandes con entradas y salida en memoria compartida."""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from formulas import REGISTRY, as_columns, evaluate_columns
+
+# Filas mínimas por fragmento: por debajo de esto el reparto cuesta más de lo que ahorra
+EVALUATE_MIN_SHARD = 1 << 16
+
+_EXECUTORS = {}
+_EXECUTORS_LOCK = threading.Lock()
+
+
+def _executor(workers: int) -> ProcessPoolExecutor:
+    """Pool de procesos persistente por número de trabajadores."""
+    with _EXECUTORS_LOCK:
+        pool = _EXECUTORS.get(workers)
+        if pool is None:
+            pool = _EXECUTORS[workers] = ProcessPoolExecutor(max_workers=workers)
+        return pool
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    """Abre un bloque existente sin que este proceso pase a ser responsable de liberarlo."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: los hijos comparten el resource tracker del padre, que ya lo tiene registrado
+        return shared_memory.SharedMemory(name=name)
+
+
+def _evaluate_shard(formula_id: str, inputs: dict, output: tuple, start: int, stop: int) -> str:
+    """Evalúa las filas [start, stop) leyendo y escribiendo directamente en memoria compartida."""
+    record = REGISTRY.get(formula_id)
+    blocks = []
+    try:
+        cols = {}
+        for name, (shm_name, dtype, shape, broadcast) in inputs.items():
+            shm = attach(shm_name)
+            blocks.append(shm)
+            arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            if broadcast:
+                cols[name] = np.broadcast_to(arr[0], (stop - start,) + shape[1:])
+            else:
+                cols[name] = arr[start:stop]
+        shm = attach(output[0])
+        blocks.append(shm)
+        out = np.ndarray(output[2], dtype=output[1], buffer=shm.buf)
+        with np.errstate(all="ignore"):
+            result, unit = record.vfn(cols)
+        out[start:stop] = result
+        del cols, out, arr, result
+        return unit
+    finally:
+        for shm in blocks:
+            shm.close()
+
+
+def _to_shared(arr: np.ndarray, blocks: list):
+    """Copia ``arr`` a un bloque nuevo de memoria compartida y devuelve la vista sobre él."""
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    blocks.append(shm)
+    view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+    view[...] = arr
+    return shm.name, view
+
+
+def evaluate(formula_id: str, arrays: dict, workers: int = None, min_shard: int = EVALUATE_MIN_SHARD) -> dict:
+    """Evalúa columnas grandes repartiendo filas entre ``workers`` procesos.
+
+    Entradas y salida viven en ``multiprocessing.shared_memory``: a cada proceso solo se le
+    envían nombres de bloque y límites de filas, nunca los datos. Devuelve lo mismo que
+    calculate_batch (``value``, ``unit``, ``valid``).
+    """
+    record = REGISTRY.get(formula_id)
+    cols = as_columns(record.fields, arrays, record.vector)
+    n = len(next(iter(cols.values()))) if cols else 0
+    workers = workers or os.cpu_count() or 1
+    shards = min(4 * workers, n // max(min_shard, 1))
+    if workers <= 1 or shards < 2:
+        result, unit, valid = evaluate_columns(record, cols)
+        return {"value": result, "unit": unit, "valid": valid}
+
+    blocks = []
+    try:
+        inputs = {}
+        for name, col in cols.items():
+            # Las columnas repetidas (escalares o una sola fila) viajan como una única fila
+            broadcast = col.strides[0] == 0
+            data = np.ascontiguousarray(col[:1] if broadcast else col, dtype=np.float64)
+            shm_name, _view = _to_shared(data, blocks)
+            inputs[name] = (shm_name, data.dtype.str, data.shape, broadcast)
+        out_name, out = _to_shared(np.empty(n, dtype=np.float64), blocks)
+        output = (out_name, out.dtype.str, out.shape)
+
+        bounds = np.linspace(0, n, shards + 1).astype(np.int64).tolist()
+        pool = _executor(workers)
+        futures = [
+            pool.submit(_evaluate_shard, record.key, inputs, output, start, stop)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        units = [f.result() for f in futures]
+        result = out.copy()
+        del out, _view
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+    return {"value": result, "unit": units[0], "valid": np.isfinite(result)}
@@ -0,0 +1,233 @@
+"""Perfilado por muestreo de la API, activable en caliente para una fracción de peticiones o una ventana de tiempo.
+
+Un hilo muestrea las pilas de los hilos que atienden peticiones marcadas y las agrega por
+(ruta, fórmula). Se exportan en formato de pilas colapsadas (flamegraph.pl, speedscope) y como
+fichero pstats para ``python -m pstats`` o snakeviz.
+"""
+
+import marshal
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from metricas import current_request, formula_label, run_tagged
+
+# Profundidad máxima de pila muestreada (se conservan los marcos más cercanos a la hoja)
+MAX_DEPTH = 128
+
+_RUN_TAGGED = run_tagged.__code__
+
+
+def _frame_key(code) -> tuple:
+    return code.co_filename, code.co_firstlineno, code.co_qualname
+
+
+class Profiler:
+    """Muestreador de pilas; seguro entre hilos y sin coste mientras está parado."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._active = {}  # marco del middleware -> (scope, estado de métricas, pilas de la petición)
+        self._stacks = {}  # (ruta, fórmula) -> Counter(pila raíz->hoja)
+        self._requests = Counter()
+        self.fraction = 1.0
+        self.interval = 0.005
+        self.started = None
+        self.until = None
+
+    # ---------- Control ----------
+    def start(self, fraction: float = 1.0, duration: float = None, interval_ms: float = 5.0):
+        """Empieza a muestrear ``fraction`` de las peticiones, durante ``duration`` segundos o hasta stop()."""
+        if not 0 < fraction <= 1:
+            raise ValueError("La fracción de peticiones debe estar en (0, 1]")
+        self.stop()
+        with self._lock:
+            self._stacks, self._requests = {}, Counter()
+            self.fraction, self.interval = fraction, interval_ms / 1000
+            self.started = time.monotonic()
+            self.until = self.started + duration if duration else None
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._sample_loop, name="calc-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Detiene el muestreo; lo recogido sigue disponible para exportar."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        if thread is not threading.current_thread():
+            thread.join()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and not self._stop.is_set()
+
+    def should_sample(self) -> bool:
+        if not self.running:
+            return False
+        return self.fraction >= 1 or random.random() < self.fraction
+
+    def status(self) -> dict:
+        with self._lock:
+            keys = sorted(set(self._stacks) | set(self._requests))
+            routes = [
+                {
+                    "route": route,
+                    "formula_id": formula_id,
+                    "requests": self._requests[(route, formula_id)],
+                    "samples": sum(self._stacks.get((route, formula_id), {}).values()),
+                }
+                for route, formula_id in keys
+            ]
+        remaining = max(0.0, self.until - time.monotonic()) if self.running and self.until else None
+        return {
+            "running": self.running,
+            "fraction": self.fraction,
+            "interval_ms": self.interval * 1000,
+            "remaining": remaining,
+            "routes": routes,
+        }
+
+    # ---------- Marcado de peticiones ----------
+    def enter(self, frame, scope, current):
+        with self._lock:
+            self._active[frame] = (scope, current, Counter())
+
+    def exit(self, frame):
+        # La etiqueta se resuelve al final: la fórmula solo se conoce tras validar el cuerpo
+        with self._lock:
+            scope, current, stacks = self._active.pop(frame)
+            label = self._label(scope, current)
+            self._requests[label] += 1
+            if stacks:
+                self._stacks.setdefault(label, Counter()).update(stacks)
+
+    @staticmethod
+    def _label(scope, current) -> tuple:
+        route = getattr(scope.get("route"), "path", None) or "unmatched"
+        return route, formula_label(current["formula_id"]) if current is not None else ""
+
+    # ---------- Muestreo ----------
+    def _sample_loop(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            if self.until is not None and time.monotonic() >= self.until:
+                self._stop.set()
+                break
+            with self._lock:
+                if not self._active:
+                    continue
+                active = dict(self._active)
+            workers = {
+                tag[1]["worker"]: tag for tag in active.values() if tag[1] is not None and tag[1]["worker"] is not None
+            }
+            samples = []
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                tag = workers.get(tid)
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    if tag is None and frame in active:
+                        tag = active[frame]
+                        break
+                    if tag is not None and frame.f_code is _RUN_TAGGED:
+                        break
+                    stack.append(_frame_key(frame.f_code))
+                    frame = frame.f_back
+                if tag is not None and stack:
+                    stack.reverse()
+                    samples.append((tag[2], tuple(stack)))
+            frame = None  # no retener marcos de otros hilos hasta la siguiente muestra
+            if samples:
+                with self._lock:
+                    for stacks, stack in samples:
+                        stacks[stack] += 1
+
+    def _selected(self, route: str = None, formula_id: str = None):
+        with self._lock:
+            return [
+                (label, Counter(stacks))
+                for label, stacks in sorted(self._stacks.items())
+                if (route is None or label[0] == route) and (formula_id is None or label[1] == formula_id)
+            ]
+
+    # ---------- Exportación ----------
+    def collapsed(self, route: str = None, formula_id: str = None) -> str:
+        """Pilas colapsadas: "ruta;fórmula;marco;...;marco N" por línea, con la raíz primero."""
+        lines = []
+        for (r, f), stacks in self._selected(route, formula_id):
+            prefix = f"{r};{f or '-'}"
+            for stack, n in stacks.most_common():
+                frames = ";".join(f"{name} ({filename}:{line})" for filename, line, name in stack)
+                lines.append(f"{prefix};{frames} {n}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def pstats(self, route: str = None, formula_id: str = None) -> bytes:
+        """Estadísticas en el formato de ``pstats`` (marshal), con tiempo = muestras x intervalo.
+
+        Sin recuentos reales de llamadas: cada muestra cuenta como una llamada de la función
+        que la contiene, así que ``ncalls`` es orientativo y ``tottime``/``cumtime`` son estimaciones.
+        """
+        dt = self.interval
+        stats = {}
+
+        def entry(key):
+            if key not in stats:
+                stats[key] = [0, 0, 0.0, 0.0, {}]
+            return stats[key]
+
+        for _, stacks in self._selected(route, formula_id):
+            for stack, n in stacks.items():
+                seen = set()
+                for i, key in enumerate(stack):
+                    e = entry(key)
+                    if key not in seen:
+                        seen.add(key)
+                        e[0] += n
+                        e[1] += n
+                        e[3] += n * dt
+                    if i:
+                        caller = e[4].setdefault(stack[i - 1], [0, 0, 0.0, 0.0])
+                        caller[0] += n
+                        caller[1] += n
+                        caller[3] += n * dt
+                entry(stack[-1])[2] += n * dt
+        return marshal.dumps({
+            key: (cc, nc, tt, ct, {c: tuple(v) for c, v in callers.items()})
+            for key, (cc, nc, tt, ct, callers) in stats.items()
+        })
+
+
+PROFILER = Profiler()
+
+
+class ProfilerMiddleware:
+    """Middleware ASGI que marca para muestreo las peticiones elegidas mientras el perfilador está activo.
+
+    Debe quedar dentro de MetricsMiddleware para ver la fórmula y el hilo de cálculo de la petición.
+    """
+
+    def __init__(self, app, profiler: Profiler = PROFILER, exclude=("/metrics", "/debug/")):
+        self.app = app
+        self.profiler = profiler
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude) or not self.profiler.should_sample():
+            await self.app(scope, receive, send)
+            return
+        # El marco de esta corrutina identifica la petición en las pilas del bucle de eventos
+        frame = sys._getframe()
+        self.profiler.enter(frame, scope, current_request())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.exit(frame)
+            del frame
@@ -0,0 +1,215 @@
+"""Codificación de resultados columnares (JSON, NDJSON en streaming, binario, Arrow, .npy y MessagePack)."""
+
+import io
+import json
+import struct
+
+import numpy as np
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+BINARY_MEDIA_TYPE = "application/octet-stream"
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": NDJSON_MEDIA_TYPE,
+    "binary": BINARY_MEDIA_TYPE,
+}
+
+JSON_MEDIA_TYPE = "application/json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+NPY_MEDIA_TYPE = "application/x-npy"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Columnas que no se enmascaran con la validez del resultado
+_UNMASKED = ("valid",)
+
+
+def columns_to_json(columns: dict, inputs=()) -> dict:
+    """Convierte columnas NumPy en listas; los resultados inválidos o no finitos pasan a ``None``."""
+    valid = columns["valid"]
+    out = {}
+    for name, arr in columns.items():
+        if name in _UNMASKED or name in inputs:
+            out[name] = arr.tolist()
+        else:
+            out[name] = np.where(json_mask(valid, arr), arr, None).tolist()
+    return out
+
+
+def json_mask(valid: np.ndarray, arr: np.ndarray) -> np.ndarray:
+    """Celdas representables en JSON: fila válida y, si es numérica, valor finito (admite columnas 2-D)."""
+    mask = valid if arr.ndim == 1 else valid[:, None]
+    return mask & np.isfinite(arr) if arr.dtype.kind == "f" else mask
+
+
+def json_bytes(obj) -> bytes:
+    """Serializa como JSONResponse de Starlette (UTF-8, compacto, sin NaN)."""
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_line(obj) -> bytes:
+    """Una línea NDJSON (mismas reglas que json_bytes: sin NaN ni Infinity)."""
+    return json_bytes(obj) + b"\n"
+
+
+def ndjson_stream(header: dict, chunks, inputs=()):
+    """Genera una línea de cabecera, una línea por bloque ``(offset, columnas)`` y un cierre."""
+    yield json_line(header)
+    count = 0
+    for offset, columns in chunks:
+        size = len(columns["valid"])
+        yield json_line({"offset": offset, "count": size, "columns": columns_to_json(columns, inputs)})
+        count += size
+    yield json_line({"done": True, "count": count})
+
+
+def binary_columns(columns: dict) -> list:
+    """Columnas numéricas que viajan en el flujo binario (la validez va como NaN en ``value``)."""
+    return [k for k, v in columns.items() if k != "valid" and v.dtype.kind == "f"]
+
+
+def binary_stream(names, chunks, inputs=()):
+    """Filas float64 little-endian intercaladas en el orden de ``names``, un bloque por chunk.
+
+    Cada fila ocupa ``8 * len(names)`` bytes, de modo que el cliente puede leer el flujo
+    sin marcas de bloque. Los resultados de filas inválidas se envían como NaN.
+    """
+    masked = [j for j, name in enumerate(names) if name not in inputs]
+    for _offset, columns in chunks:
+        block = np.empty((len(columns["valid"]), len(names)), dtype="<f8")
+        for j, name in enumerate(names):
+            block[:, j] = columns[name]
+        invalid = ~columns["valid"]
+        if invalid.any():
+            block[np.ix_(invalid, masked)] = np.nan
+        yield block.tobytes()
+
+
+# ---------- Negociación de contenido para respuestas columnares completas ----------
+def negotiate(accept: str):
+    """Tipo binario preferido según la cabecera Accept, o None si corresponde JSON.
+
+    Gana el mayor ``q``; a igualdad, el primero de la lista. Los tipos desconocidos se ignoran.
+    """
+    best, best_q = JSON_MEDIA_TYPE, 0.0
+    for part in (accept or "").split(","):
+        media, *params = [p.strip() for p in part.split(";")]
+        if media not in COLUMN_ENCODERS and media != JSON_MEDIA_TYPE:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    pass
+        if q > best_q:
+            best, best_q = media, q
+    return None if best == JSON_MEDIA_TYPE else best
+
+
+def _masked(columns: dict, inputs, blank="") -> dict:
+    """Columnas con los resultados de filas inválidas a NaN, o a ``blank`` si son texto (entradas y ``valid`` sin tocar)."""
+    invalid = ~columns["valid"]
+    if not invalid.any():
+        return columns
+    out = {}
+    for name, arr in columns.items():
+        if name in _UNMASKED or name in inputs:
+            out[name] = arr
+        elif arr.dtype.kind == "f":
+            out[name] = np.where(invalid, np.nan, arr)
+        elif arr.dtype.kind in "USO":
+            out[name] = np.where(invalid, blank, arr)
+        else:
+            out[name] = arr
+    return out
+
+
+def npy_columns(columns: dict, meta: dict, inputs=()) -> list:
+    """Array estructurado .npy (un campo por columna); devuelve [cabecera, buffer de datos]."""
+    columns = _masked(columns, inputs)
+    n = len(columns["valid"])
+    table = np.empty(n, dtype=[(name, arr.dtype.newbyteorder("<")) for name, arr in columns.items()])
+    for name, arr in columns.items():
+        table[name] = arr
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, np.lib.format.header_data_from_array_1_0(table))
+    return [header.getvalue(), memoryview(table).cast("B")]
+
+
+def _msgpack(obj, out: list):
+    """Codificador MessagePack mínimo; los arreglos numéricos van como {dtype, shape, data: bin}."""
+    if obj is None:
+        out.append(b"\xc0")
+    elif obj is True or obj is False:
+        out.append(b"\xc3" if obj else b"\xc2")
+    elif isinstance(obj, (int, np.integer)):
+        v = int(obj)
+        out.append(struct.pack("B", v) if 0 <= v < 128 else b"\xd3" + struct.pack(">q", v))
+    elif isinstance(obj, (float, np.floating)):
+        out.append(b"\xcb" + struct.pack(">d", float(obj)))
+    elif isinstance(obj, str):
+        data = obj.encode("utf-8")
+        n = len(data)
+        out.append((struct.pack("B", 0xA0 | n) if n < 32 else b"\xdb" + struct.pack(">I", n)) + data)
+    elif isinstance(obj, (bytes, memoryview)):
+        out.append(b"\xc6" + struct.pack(">I", memoryview(obj).nbytes))
+        out.append(obj)
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype.kind in "biuf":
+            arr = np.ascontiguousarray(obj, dtype=obj.dtype.newbyteorder("<"))
+            _msgpack({"dtype": arr.dtype.str, "shape": list(arr.shape), "data": memoryview(arr).cast("B")}, out)
+        else:
+            _msgpack(obj.tolist(), out)
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        out.append(struct.pack("B", 0x90 | n) if n < 16 else b"\xdd" + struct.pack(">I", n))
+        for item in obj:
+            _msgpack(item, out)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        out.append(struct.pack("B", 0x80 | n) if n < 16 else b"\xdf" + struct.pack(">I", n))
+        for key, value in obj.items():
+            _msgpack(str(key), out)
+            _msgpack(value, out)
+    else:
+        raise TypeError(f"No se puede codificar {type(obj).__name__} en MessagePack")
+
+
+def msgpack_columns(columns: dict, meta: dict, inputs=()) -> list:
+    """Mapa MessagePack con los metadatos y ``columns`` como buffers binarios sin convertir."""
+    out = []
+    # Los textos de filas inválidas van como nil, igual que los nulos de JSON y Arrow
+    _msgpack({**meta, "columns": _masked(columns, inputs, blank=None)}, out)
+    return out
+
+
+def arrow_columns(columns: dict, meta: dict, inputs=()) -> list:
+    """Flujo IPC de Arrow con un único lote; las filas inválidas son nulos en las columnas de resultado."""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("El formato Arrow necesita el paquete 'pyarrow'") from None
+    invalid = ~columns["valid"]
+    arrays = [
+        pa.array(arr, mask=invalid if name not in _UNMASKED and name not in inputs and invalid.any() else None)
+        for name, arr in columns.items()
+    ]
+    batch = pa.RecordBatch.from_arrays(arrays, names=list(columns))
+    batch = batch.replace_schema_metadata({"meta": json.dumps(meta, ensure_ascii=False)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return [memoryview(sink.getvalue())]
+
+
+COLUMN_ENCODERS = {
+    ARROW_MEDIA_TYPE: arrow_columns,
+    NPY_MEDIA_TYPE: npy_columns,
+    MSGPACK_MEDIA_TYPE: msgpack_columns,
+}
+
+
+def encode_columns(media_type: str, columns: dict, meta: dict, inputs=()) -> bytes:
+    """Codifica columnas completas en ``media_type`` uniendo los buffers NumPy en una sola copia."""
+    return b"".join(COLUMN_ENCODERS[media_type](columns, meta, inputs))
@@ -0,0 +1,312 @@
+"""Cálculo continuo sobre telemetría: lectura en micro-lotes, fórmulas vectorizadas y agregados por ventana.
+
+Uso: python telemetria.py [--format csv|ndjson] [--ws URL] [ficheros...]  (sin ficheros lee stdin)
+"""
+
+import argparse
+import json
+import math
+import sys
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+import numpy as np
+
+from columnas import parse_csv
+from formulas import derive
+from respuestas import json_line
+
+# Registros por micro-lote y tamaño por defecto de la ventana deslizante
+TELEMETRY_BATCH = 4096
+TELEMETRY_WINDOW = 10_000
+
+# Espera máxima (s) de un registro antes de emitir su lote aunque esté incompleto
+TELEMETRY_MAX_DELAY = 0.5
+
+# Líneas leídas por adelantado en el hilo lector
+_READ_AHEAD = 1 << 14
+
+
+# ---------- Fuentes ----------
+def read_lines(sources=("-",)):
+    """Genera líneas de texto de cada fuente ("-" es stdin) en orden."""
+    for source in sources:
+        if source == "-":
+            yield from sys.stdin
+            continue
+        with open(source, encoding="utf-8") as f:
+            yield from f
+
+
+def websocket_lines(url: str):
+    """Genera las líneas de los mensajes recibidos por WebSocket (requiere el paquete ``websockets``)."""
+    try:
+        from websockets.sync.client import connect
+    except ImportError:
+        raise RuntimeError("Para leer de WebSocket se necesita el paquete 'websockets'") from None
+    with connect(url) as ws:
+        for message in ws:
+            if isinstance(message, bytes):
+                message = message.decode("utf-8")
+            yield from message.splitlines()
+
+
+# ---------- Micro-lotes ----------
+def _number(value) -> float:
+    # Como en CSV: los textos no numéricos, booleanos, nulos y objetos son NaN
+    if isinstance(value, (int, float, str)) and not isinstance(value, bool):
+        try:
+            return float(value)
+        except (ValueError, OverflowError):
+            pass
+    return math.nan
+
+
+def _record(line: str) -> dict:
+    try:
+        rec = json.loads(line)
+    except ValueError:
+        return {}
+    return rec if isinstance(rec, dict) else {}
+
+
+def _parse_ndjson(lines) -> dict:
+    records = [_record(line) for line in lines]
+    names = {}
+    for rec in records:
+        names.update(dict.fromkeys(rec))
+    return {
+        name: np.fromiter((_number(rec.get(name)) for rec in records), dtype=np.float64, count=len(records))
+        for name in names
+    }
+
+
+def _read_ahead(lines, timeout):
+    """Genera listas con las líneas que un hilo lector ya tiene disponibles.
+
+    La lista vacía indica que pasaron ``timeout()`` segundos sin ninguna línea nueva.
+    """
+    buffer = deque()
+    cond = threading.Condition()
+    state = {"waiting": False, "done": False, "error": None}
+
+    def reader():
+        try:
+            for line in lines:
+                # append es atómico: el cerrojo solo hace falta para despertar al consumidor o esperarle
+                buffer.append(line)
+                if state["waiting"] or len(buffer) >= _READ_AHEAD:
+                    with cond:
+                        cond.notify()
+                        while len(buffer) >= _READ_AHEAD:
+                            cond.wait()
+        except BaseException as e:
+            state["error"] = e
+        with cond:
+            state["done"] = True
+            cond.notify()
+
+    threading.Thread(target=reader, name="telemetry-reader", daemon=True).start()
+    while True:
+        with cond:
+            state["waiting"] = True
+            if not buffer and not state["done"]:
+                cond.wait(timeout())
+            state["waiting"] = False
+            done = state["done"]
+            chunk = [buffer.popleft() for _ in range(len(buffer))]
+            cond.notify()
+        yield chunk
+        if done and not chunk:
+            if state["error"] is not None:
+                raise state["error"]
+            return
+
+
+def micro_batches(lines, fmt: str = "csv", size: int = TELEMETRY_BATCH, max_delay: float = None):
+    """Agrupa las líneas en lotes de hasta ``size`` registros y los convierte en columnas float64.
+
+    En CSV la primera línea es la cabecera; en NDJSON cada línea es un objeto y los campos
+    ausentes, nulos o no numéricos quedan como NaN. Con ``max_delay`` (segundos) un lote se emite
+    incompleto cuando su primer registro lleva ese tiempo esperando, así que una fuente lenta
+    produce resultados sin esperar a reunir ``size`` registros.
+    """
+    names = None
+    batch = []
+    deadline = None
+
+    def timeout():
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    def parse():
+        return parse_csv(names, batch) if fmt == "csv" else _parse_ndjson(batch)
+
+    if max_delay is None:
+        it = iter(lines)
+        chunks = iter(lambda: list(islice(it, _READ_AHEAD)), [])
+    else:
+        chunks = _read_ahead(lines, timeout)
+    for chunk in chunks:
+        for line in chunk:
+            if not line.strip():
+                continue
+            if fmt == "csv" and names is None:
+                names = [n.strip() for n in line.strip().split(",")]
+                continue
+            batch.append(line)
+            if deadline is None and max_delay is not None:
+                deadline = time.monotonic() + max_delay
+            if len(batch) >= size:
+                yield parse()
+                batch, deadline = [], None
+        if deadline is not None and time.monotonic() >= deadline:
+            yield parse()
+            batch, deadline = [], None
+    if batch:
+        yield parse()
+
+
+# ---------- Agregados por ventana ----------
+class RollingWindow:
+    """Últimos ``size`` valores de cada magnitud en buffers circulares preasignados."""
+
+    def __init__(self, size: int = TELEMETRY_WINDOW, percentiles=(50, 95, 99)):
+        self.size = size
+        self.percentiles = tuple(percentiles)
+        self._buffers = {}
+        self._pos = {}
+        self._filled = {}
+
+    def push(self, name: str, values: np.ndarray):
+        buf = self._buffers.get(name)
+        if buf is None:
+            buf = self._buffers[name] = np.full(self.size, np.nan)
+            self._pos[name] = self._filled[name] = 0
+        values = values[-self.size:]
+        pos, n = self._pos[name], len(values)
+        first = min(n, self.size - pos)
+        buf[pos:pos + first] = values[:first]
+        buf[: n - first] = values[first:]
+        self._pos[name] = (pos + n) % self.size
+        self._filled[name] = min(self.size, self._filled[name] + n)
+
+    def summary(self, name: str) -> dict:
+        buf = self._buffers[name][: self._filled[name]]
+        valid = buf[np.isfinite(buf)]
+        if not valid.size:
+            return {"count": 0}
+        out = {
+            "count": int(valid.size),
+            "min": float(valid.min()),
+            "mean": float(valid.mean()),
+            "max": float(valid.max()),
+        }
+        if self.percentiles:
+            for p, v in zip(self.percentiles, np.percentile(valid, self.percentiles)):
+                out[f"p{p:g}"] = float(v)
+        return out
+
+
+# ---------- Tubería ----------
+class TelemetryPipeline:
+    """Evalúa todas las fórmulas derivables de cada micro-lote y mantiene agregados por ventana.
+
+    ``mapping`` renombra columnas de entrada a campos de fórmula (p. ej. {"snr": "S"}),
+    ``constants`` fija campos que no llegan en la telemetría y ``outputs`` limita las magnitudes
+    emitidas (por defecto, todas las calculadas).
+    """
+
+    def __init__(self, mapping=None, constants=None, outputs=None, window: int = TELEMETRY_WINDOW,
+                 percentiles=(50, 95, 99)):
+        self.mapping = dict(mapping or {})
+        self.constants = dict(constants or {})
+        self.outputs = tuple(outputs) if outputs else None
+        self.window = RollingWindow(window, percentiles)
+        self.count = 0
+
+    def process(self, cols: dict) -> dict:
+        """Calcula un lote y devuelve sus resultados y los agregados de la ventana."""
+        n = len(next(iter(cols.values()))) if cols else 0
+        values = {self.mapping.get(k, k): v for k, v in cols.items()}
+        for name, value in self.constants.items():
+            values.setdefault(name, np.full(n, value))
+        quantities = derive(values)["quantities"]
+        results = {}
+        for name, entry in quantities.items():
+            if "value" not in entry or (self.outputs and name not in self.outputs):
+                continue
+            value = np.where(entry["valid"], entry["value"], np.nan)
+            self.window.push(name, value)
+            results[name] = value
+        offset, self.count = self.count, self.count + n
+        return {
+            "offset": offset,
+            "count": n,
+            "results": results,
+            "window": {name: self.window.summary(name) for name in results},
+        }
+
+    def run(self, batches):
+        """Generador: un resultado por micro-lote, en cuanto se calcula."""
+        for cols in batches:
+            if cols:
+                yield self.process(cols)
+
+
+def _records_json(results: dict) -> dict:
+    return {name: np.where(np.isfinite(v), v, None).tolist() for name, v in results.items()}
+
+
+def _pairs(items, option: str) -> dict:
+    out = {}
+    for item in items or ():
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"{option}: se esperaba NOMBRE=VALOR y se recibió '{item}'")
+        out[key] = value
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calcula fórmulas sobre telemetría en flujo continuo (NDJSON en stdout).")
+    parser.add_argument("sources", nargs="*", default=["-"], help="Ficheros de entrada ('-' es stdin)")
+    parser.add_argument("--ws", help="URL WebSocket de la que leer en lugar de ficheros")
+    parser.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+    parser.add_argument("--batch", type=int, default=TELEMETRY_BATCH, help="Registros por micro-lote")
+    parser.add_argument(
+        "--max-delay", type=float, default=TELEMETRY_MAX_DELAY,
+        help="Segundos que puede esperar un registro antes de emitir su lote incompleto (0 = sin límite)",
+    )
+    parser.add_argument("--window", type=int, default=TELEMETRY_WINDOW, help="Registros en la ventana de agregados")
+    parser.add_argument("--map", action="append", metavar="COLUMNA=CAMPO", help="Renombra una columna de entrada")
+    parser.add_argument("--const", action="append", metavar="CAMPO=VALOR", help="Valor fijo para un campo")
+    parser.add_argument("--output", action="append", metavar="MAGNITUD", help="Magnitud a emitir (repetible)")
+    parser.add_argument("--no-records", action="store_true", help="Emitir solo los agregados de la ventana")
+    args = parser.parse_args(argv)
+
+    constants = {k: float(v) for k, v in _pairs(args.const, "--const").items()}
+    pipeline = TelemetryPipeline(_pairs(args.map, "--map"), constants, args.output, args.window)
+    lines = websocket_lines(args.ws) if args.ws else read_lines(args.sources)
+    out = getattr(sys.stdout, "buffer", None)
+    started = time.perf_counter()
+    batches = micro_batches(lines, args.format, args.batch, args.max_delay or None)
+    for res in pipeline.run(batches):
+        line = {"offset": res["offset"], "count": res["count"], "window": res["window"]}
+        if not args.no_records:
+            line["results"] = _records_json(res["results"])
+        data = json_line(line)
+        if out is not None:
+            out.write(data)
+            out.flush()
+        else:
+            sys.stdout.write(data.decode("utf-8"))
+            sys.stdout.flush()
+    elapsed = time.perf_counter() - started
+    rate = pipeline.count / elapsed if elapsed > 0 else 0.0
+    print(f"{pipeline.count} registros en {elapsed:.2f} s ({rate:,.0f} registros/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from formulas import SweepGrid, SweepRange
+
+
+@pytest.mark.parametrize("start, stop, num, scale", [
+    (1.0, 10.0, 7, "linear"),
+    (-3.0, 7.0, 1000, "linear"),
+    (5.0, 5.0, 1, "linear"),
+    (1e3, 1e9, 101, "log"),
+    (1e-3, 2.0, 2, "log"),
+])
+def test_eje_coincide_con_numpy(start, stop, num, scale):
+    expected = np.linspace(start, stop, num) if scale == "linear" else np.geomspace(start, stop, num)
+    assert np.array_equal(SweepRange(start, stop, num, scale).values(), expected)
+
+
+def test_rejilla_no_materializa_los_ejes():
+    grid = SweepGrid("shannon", {"B": {"start": 1.0, "stop": 2.0, "num": 10**9}}, {"S": 1.0, "N": 1.0})
+    assert grid.size == 10**9
+    cols = grid.chunk(grid.size - 2, grid.size)
+    assert cols["B"].tolist() == pytest.approx([2.0 - 1.0 / (10**9 - 1), 2.0], rel=1e-15)
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from coalescencia import MicroBatcher, SingleFlight
+from formulas import cache_stats, calculate_by_id, calculate_many, configure_cache
+
+
+def test_calculate_many_aisla_peticiones_mal_formadas():
+    good = {"B": 1e6, "S": 10.0, "N": 1.0}
+    bad = {"B": [1e6, 2.0], "S": 10.0, "N": 1.0}
+    out = calculate_many("shannon", [good, bad, dict(good, B=2e6)])
+    assert out[0] == calculate_by_id("shannon", good)
+    assert isinstance(out[1], Exception)
+    assert out[2] == calculate_by_id("shannon", dict(good, B=2e6))
+
+
+def test_microbatch_mixto_solo_falla_la_peticion_mala():
+    async def run():
+        batcher = MicroBatcher(0.02)
+        return await asyncio.gather(
+            batcher.submit("shannon", {"B": 1e6, "S": 10.0, "N": 1.0}),
+            batcher.submit("shannon", {"B": [1e6, 2.0], "S": 10.0, "N": 1.0}),
+            batcher.submit("shannon", {"B": 2e6, "S": 10.0, "N": 1.0}),
+            return_exceptions=True,
+        )
+
+    first, bad, third = asyncio.run(run())
+    assert first["value"] == pytest.approx(calculate_by_id("shannon", {"B": 1e6, "S": 10.0, "N": 1.0})["value"])
+    assert isinstance(bad, Exception)
+    assert third["value"] == pytest.approx(2 * first["value"])
+
+
+def test_calculate_many_usa_la_cache_de_resultados():
+    configure_cache(16)
+    try:
+        requests = [{"B": 1e6, "S": 10.0, "N": 1.0}] * 3 + [{"B": 2e6, "S": 10.0, "N": 1.0}]
+        first = calculate_many("shannon", requests)
+        assert cache_stats()["size"] == 2
+        again = calculate_many("shannon", requests)
+        assert again == first
+        assert cache_stats()["hits"] == len(requests)
+        assert calculate_by_id("shannon", requests[0]) == first[0]
+    finally:
+        configure_cache(0)
+
+
+def test_singleflight_colapsa_peticiones_identicas_concurrentes():
+    calls = []
+
+    async def run():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def compute(key):
+            calls.append(key)
+            await release.wait()
+            return {"key": key}
+
+        waiters = [asyncio.ensure_future(flight.do(k, lambda k=k: compute(k))) for k in "aaaab"]
+        await asyncio.sleep(0)
+        assert flight.stats()["in_flight"] == 2
+        release.set()
+        results = await asyncio.gather(*waiters)
+        return flight.stats(), results
+
+    stats, results = asyncio.run(run())
+    assert sorted(calls) == ["a", "b"]
+    assert [r["key"] for r in results] == list("aaaab")
+    assert (stats["leaders"], stats["collapsed"], stats["in_flight"]) == (2, 3, 0)
+
+
+def test_singleflight_sigue_tras_cancelar_al_primero_y_propaga_errores():
+    async def run():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            raise ValueError("fallo")
+
+        first = asyncio.ensure_future(flight.do("k", compute))
+        second = asyncio.ensure_future(flight.do("k", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        with pytest.raises(ValueError, match="fallo"):
+            await second
+        return flight.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["leaders"], stats["collapsed"], stats["in_flight"]) == (1, 1, 0)
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from formulas import REGISTRY, calculate_batch, calculate_by_id, solve, water_filling
+
+
+def test_lista_en_campo_escalar():
+    with pytest.raises(ValueError, match="'B' admite un solo valor"):
+        calculate_by_id("shannon", {"B": [1e6], "S": 10.0, "N": 1.0})
+    assert calculate_by_id("cascade_noise", {"F": [2.0, 3.0], "G": [10.0, 10.0]})["value"] == pytest.approx(2.2)
+
+
+# Valores de ejemplo dentro del dominio de cada fórmula escalar
+SAMPLES = {
+    "bandwidth": {"Fmax": 2e6, "Fmin": 1e6},
+    "shannon": {"B": 1e6, "S": 10.0, "N": 1.0},
+    "noise_power": {"T": 290.0, "B": 1e6},
+    "noise_voltage": {"R": 50.0, "T": 290.0, "B": 1e6},
+    "noise_factor": {"S_in": 1.0, "N_in": 0.1, "S_out": 5.0, "N_out": 1.0},
+    "noise_figure": {"F": 2.0},
+    "fspl": {"d": 1e3, "f": 1e9},
+    "link_budget": {
+        "Pt": 1.0, "Gt": 10.0, "Gr": 10.0, "L": 2.0, "d": 1e4, "f": 2.4e9, "B": 1e6, "T": 290.0, "NF": 3.0,
+    },
+}
+
+SCALAR_FIELDS = [(r.key, f) for r in REGISTRY if not r.vector for f in r.fields]
+
+
+def test_hay_ejemplo_para_cada_formula_escalar():
+    assert {key for key, _ in SCALAR_FIELDS} == set(SAMPLES)
+
+
+@pytest.mark.parametrize("formula_id, unknown", SCALAR_FIELDS)
+def test_solve_recupera_cada_campo(formula_id, unknown):
+    values = {f: np.array([v, 1.5 * v]) for f, v in SAMPLES[formula_id].items()}
+    target = calculate_batch(formula_id, values)["value"]
+    known = {f: v for f, v in values.items() if f != unknown}
+    res = solve(formula_id, unknown, target, known)
+    assert res["valid"].all()
+    assert res["value"] == pytest.approx(values[unknown], rel=1e-6)
+
+
+def test_solve_marca_filas_sin_solucion():
+    res = solve("link_budget", "d", [1e6, -1.0], {f: v for f, v in SAMPLES["link_budget"].items() if f != "d"})
+    assert res["method"] == "bracketed"
+    assert res["valid"].tolist() == [True, False]
+
+
+def _water_filling_bisection(gain, noise, power, df):
+    """Referencia: nivel de agua por bisección sobre sum(max(μ − aᵢ, 0)) = P."""
+    with np.errstate(divide="ignore"):
+        a = np.asarray(noise, dtype=np.float64) / np.asarray(gain, dtype=np.float64)
+    lo, hi = 0.0, power + a[np.isfinite(a)].max()
+    for _ in range(200):
+        mu = 0.5 * (lo + hi)
+        if np.maximum(mu - a, 0.0).sum() > power:
+            hi = mu
+        else:
+            lo = mu
+    alloc = np.maximum(mu - a, 0.0)
+    return mu, alloc, df * np.sum(np.log2(1 + alloc / a))
+
+
+def test_water_filling_coincide_con_biseccion():
+    rng = np.random.default_rng(3)
+    gain = rng.exponential(1.0, (20, 64))
+    gain[:, :3] = 0.0  # subportadoras inutilizables
+    noise = rng.uniform(0.5, 2.0, (20, 64))
+    power = rng.uniform(0.1, 50.0, 20)
+    res = water_filling(gain, noise, power, df=15e3)
+    for i in range(len(power)):
+        mu, alloc, capacity = _water_filling_bisection(gain[i], noise[i], power[i], 15e3)
+        assert res["level"][i] == pytest.approx(mu, rel=1e-9)
+        assert res["power"][i] == pytest.approx(alloc, rel=1e-9, abs=1e-12)
+        assert res["capacity"][i] == pytest.approx(capacity, rel=1e-9)
+        assert res["active"][i] == np.count_nonzero(alloc)
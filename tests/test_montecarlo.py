@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from formulas import MONTE_CARLO_CHUNK, monte_carlo, monte_carlo_chunk
+
+HEAVY_TAIL = {
+    "S_in": 1.0,
+    "N_out": 1.0,
+    "N_in": {"dist": "normal", "mean": 0.1, "std": 0.03},
+    "S_out": {"dist": "normal", "mean": 10.0, "std": 3.0},
+}
+
+
+def _samples(formula_id, distributions, samples, seed):
+    seeds = np.random.SeedSequence(seed).spawn(-(-samples // MONTE_CARLO_CHUNK))
+    starts = range(0, samples, MONTE_CARLO_CHUNK)
+    return np.concatenate([
+        monte_carlo_chunk(formula_id, distributions, s, min(MONTE_CARLO_CHUNK, samples - start))
+        for s, start in zip(seeds, starts)
+    ])
+
+
+def test_percentiles_exactos_con_cola_pesada():
+    percentiles = (0, 5, 50, 95, 99.9, 100)
+    res = monte_carlo("noise_factor", HEAVY_TAIL, 1_000_000, percentiles, seed=2)
+    expected = np.percentile(_samples("noise_factor", HEAVY_TAIL, 1_000_000, 2), percentiles)
+    assert [res["percentiles"][str(p)] for p in percentiles] == pytest.approx(expected, rel=1e-12)
+
+
+def test_percentiles_con_valores_repetidos():
+    dist = {"B": {"dist": "empirical", "samples": [1e6, 2e6, 2e6, 5e6]}, "S": 10.0, "N": 1.0}
+    percentiles = (5, 37.5, 50, 95)
+    res = monte_carlo("shannon", dist, 300_000, percentiles, seed=1)
+    expected = np.percentile(_samples("shannon", dist, 300_000, 1), percentiles)
+    assert [res["percentiles"][str(p)] for p in percentiles] == pytest.approx(expected, rel=1e-12)
+
+
+@pytest.mark.parametrize("percentiles", [(150,), (-5,), (50, float("nan"))])
+def test_percentiles_fuera_de_rango(percentiles):
+    with pytest.raises(ValueError):
+        monte_carlo("noise_factor", HEAVY_TAIL, 1000, percentiles, seed=0)
@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from optimizador import optimize_chain
+
+# Con 4 etapas y 2 procesos el reparto es por pares: la etapa A sola solo aparece entre los prefijos cortos
+SOLO_PRIMERA = [
+    {"name": "A", "gain": 2.0, "noise_factor": 2.0},
+    {"name": "B", "gain": 1.5, "noise_factor": 1.5},
+    {"name": "C", "gain": 0.5, "noise_factor": 10.0},
+    {"name": "D", "gain": 0.5, "noise_factor": 10.0},
+]
+
+
+def _cases():
+    yield SOLO_PRIMERA, 2.0
+    rng = random.Random(7)
+    for _ in range(6):
+        stages = [(rng.uniform(0.5, 20.0), rng.uniform(1.0, 8.0)) for _ in range(rng.randint(4, 6))]
+        yield stages, rng.uniform(1.0, 200.0)
+
+
+@pytest.mark.parametrize("stages, min_gain", list(_cases()))
+def test_serie_y_paralelo_coinciden(stages, min_gain):
+    serial = optimize_chain(stages, min_gain=min_gain, workers=1)
+    parallel = optimize_chain(stages, min_gain=min_gain, workers=2)
+    assert parallel.optimal and serial.optimal
+    assert parallel.noise_factor == pytest.approx(serial.noise_factor, rel=1e-12)
+
+
+def test_etapa_unica_en_reparto_por_pares():
+    result = optimize_chain(SOLO_PRIMERA, min_gain=2.0, workers=2)
+    assert result.names == ("A",)
+    assert result.noise_factor == 2.0
@@ -0,0 +1,114 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from respuestas import (
+    ARROW_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE,
+    NPY_MEDIA_TYPE,
+    columns_to_json,
+    encode_columns,
+    negotiate,
+)
+
+INPUTS = ("B",)
+META = {"unit": "bits/s", "count": 3}
+
+
+def _columns():
+    return {
+        "B": np.array([1e6, 0.0, 2e6]),
+        "value": np.array([3.46e6, np.inf, 6.92e6]),
+        "valid": np.array([True, False, True]),
+        "display": np.array(["3.46 Mbits/s", "inf bits/s", "6.92 Mbits/s"]),
+    }
+
+
+def _decode_npy(data):
+    table = np.load(io.BytesIO(data))
+    return {name: table[name] for name in table.dtype.names}
+
+
+def _decode_msgpack(data):
+    msgpack = pytest.importorskip("msgpack")
+    obj = msgpack.unpackb(data)
+    cols = {}
+    for name, col in obj["columns"].items():
+        if isinstance(col, dict):
+            col = np.frombuffer(col["data"], dtype=col["dtype"]).reshape(col["shape"])
+        cols[name] = col
+    return cols
+
+
+def _decode_arrow(data):
+    pa = pytest.importorskip("pyarrow")
+    table = pa.ipc.open_stream(data).read_all()
+    return {name: table.column(name).to_pylist() for name in table.column_names}
+
+
+def _nulls(col):
+    return [v is None or v == "" or (isinstance(v, float) and np.isnan(v)) for v in list(col)]
+
+
+@pytest.mark.parametrize("media_type, decode", [
+    (NPY_MEDIA_TYPE, _decode_npy),
+    (MSGPACK_MEDIA_TYPE, _decode_msgpack),
+    (ARROW_MEDIA_TYPE, _decode_arrow),
+])
+def test_filas_invalidas_vacias_en_todas_las_codificaciones(media_type, decode):
+    expected = columns_to_json(_columns(), INPUTS)
+    cols = decode(encode_columns(media_type, _columns(), META, INPUTS))
+    assert list(cols) == list(expected)
+    for name in ("value", "display"):
+        assert _nulls(cols[name]) == [v is None for v in expected[name]]
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("", None),
+    ("application/json", None),
+    ("text/html, application/x-npy", NPY_MEDIA_TYPE),
+    ("application/msgpack;q=0.5, application/vnd.apache.arrow.stream", ARROW_MEDIA_TYPE),
+    ("application/x-npy;q=0.2, application/json;q=0.9", None),
+    ("application/msgpack, application/x-npy", MSGPACK_MEDIA_TYPE),
+    ("application/x-npy;q=abc", NPY_MEDIA_TYPE),
+])
+def test_negociacion(accept, expected):
+    assert negotiate(accept) == expected
+
+
+@pytest.mark.parametrize("media_type, decode", [
+    (NPY_MEDIA_TYPE, _decode_npy),
+    (MSGPACK_MEDIA_TYPE, _decode_msgpack),
+    (ARROW_MEDIA_TYPE, _decode_arrow),
+])
+def test_decodificacion_de_columnas_validas(media_type, decode):
+    columns = _columns()
+    columns["valid"][:] = True
+    columns["value"][1] = 0.0
+    cols = decode(encode_columns(media_type, columns, META, INPUTS))
+    for name, arr in columns.items():
+        assert list(cols[name]) == arr.tolist()
+
+
+def test_metadatos_en_msgpack_y_arrow():
+    msgpack = pytest.importorskip("msgpack")
+    pa = pytest.importorskip("pyarrow")
+    obj = msgpack.unpackb(encode_columns(MSGPACK_MEDIA_TYPE, _columns(), META, INPUTS))
+    assert {k: obj[k] for k in META} == META
+    schema = pa.ipc.open_stream(encode_columns(ARROW_MEDIA_TYPE, _columns(), META, INPUTS)).schema
+    assert json.loads(schema.metadata[b"meta"]) == META
+
+
+def test_msgpack_textos_largos_y_muchas_filas():
+    n = 40
+    columns = {
+        "B": np.arange(n, dtype=np.float64),
+        "value": np.linspace(1.0, 2.0, n),
+        "valid": np.ones(n, dtype=bool),
+        "display": np.array([f"{i:03d} " + "x" * 40 for i in range(n)]),
+    }
+    cols = _decode_msgpack(encode_columns(MSGPACK_MEDIA_TYPE, columns, META, INPUTS))
+    assert cols["display"] == columns["display"].tolist()
+    np.testing.assert_array_equal(cols["value"], columns["value"])
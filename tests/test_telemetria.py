@@ -0,0 +1,40 @@
+import time
+
+import numpy as np
+
+from columnas import parse_csv
+from telemetria import _parse_ndjson, micro_batches
+
+
+def test_csv_no_compensa_filas_con_campos_de_mas_y_de_menos():
+    cols = parse_csv(["a", "b", "c"], ["1,2,3,4", "5,6", "7,8,9"])
+    np.testing.assert_array_equal(cols["a"], [np.nan, np.nan, 7.0])
+    np.testing.assert_array_equal(cols["c"], [np.nan, np.nan, 9.0])
+
+
+def test_ndjson_une_los_campos_de_todos_los_registros():
+    cols = _parse_ndjson(['{"T": 1}', '{"T": 2, "B": 3}', '{"T": 4}'])
+    np.testing.assert_array_equal(cols["B"], [np.nan, 3.0, np.nan])
+
+
+def test_ndjson_campos_no_numericos_son_nan():
+    cols = _parse_ndjson(['{"ts": "2026-10-18T10:00:00Z", "T": 1}', '{"ts": "x", "T": "2.5", "ok": true}', "no json"])
+    np.testing.assert_array_equal(cols["ts"], [np.nan, np.nan, np.nan])
+    np.testing.assert_array_equal(cols["T"], [1.0, 2.5, np.nan])
+    np.testing.assert_array_equal(cols["ok"], [np.nan, np.nan, np.nan])
+
+
+def test_lote_incompleto_se_emite_tras_la_espera_maxima():
+    def slow():
+        yield "B,S,N"
+        yield "1e6,10,1"
+        time.sleep(0.5)
+        yield "2e6,10,1"
+
+    started = time.monotonic()
+    batches = micro_batches(slow(), "csv", size=4096, max_delay=0.05)
+    first = next(batches)
+    assert time.monotonic() - started < 0.4
+    np.testing.assert_array_equal(first["B"], [1e6])
+    np.testing.assert_array_equal(next(batches)["B"], [2e6])
+    assert next(batches, None) is None
@@ -0,0 +1,308 @@
+"""Trabajos de larga duración (barridos, optimizaciones) ejecutados fuera del ciclo de petición."""
+
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import numpy as np
+
+from formulas import SWEEP_CHUNK, SweepGrid, monte_carlo, monte_carlo_samplers
+from optimizador import optimize_chain, prepare_stages
+
+
+class QueueFullError(RuntimeError):
+    """La cola de trabajos ha alcanzado su profundidad máxima."""
+
+
+class ColumnStore:
+    """Columnas de resultado en ficheros .npy mapeados en memoria dentro de un directorio temporal."""
+
+    def __init__(self, dtypes: dict, size: int, meta: dict):
+        self.size = size
+        self.meta = meta
+        self.directory = tempfile.mkdtemp(prefix="calc-job-")
+        self.columns = {
+            name: np.lib.format.open_memmap(
+                os.path.join(self.directory, f"{name}.npy"), mode="w+", dtype=dtype, shape=(size,)
+            )
+            for name, dtype in dtypes.items()
+        }
+
+    def write(self, offset: int, cols: dict):
+        for name, arr in cols.items():
+            self.columns[name][offset:offset + len(arr)] = arr
+
+    def chunks(self, chunk_size: int = SWEEP_CHUNK):
+        """Genera (offset, columnas) leyendo los ficheros por bloques."""
+        for start in range(0, self.size, chunk_size):
+            yield start, {k: np.array(v[start:start + chunk_size]) for k, v in self.columns.items()}
+
+    def close(self):
+        self.columns = {}
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+@dataclass(slots=True)
+class Job:
+    id: str
+    kind: str
+    prepared: Any
+    status: str = "queued"
+    progress: float = 0.0
+    info: dict = field(default_factory=dict)
+    result: Any = None
+    error: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def summary(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "info": self.info,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "has_result": self.result is not None,
+        }
+
+
+# ---------- Tipos de trabajo ----------
+def _sweep_chunk(formula_id, ranges, fixed, start, stop):
+    return SweepGrid(formula_id, ranges, fixed).chunk(start, stop)
+
+
+def _prepare_sweep(params: dict):
+    grid = SweepGrid(params["formula_id"], params["ranges"], params.get("fixed"))
+    return grid, params
+
+
+def _run_sweep(manager, job: Job, prepared):
+    grid, params = prepared
+    dtypes = {name: np.float64 for name in grid.names}
+    dtypes.update(value=np.float64, valid=np.bool_)
+    meta = {
+        "formula_id": params["formula_id"],
+        "unit": grid.unit,
+        "shape": list(grid.shape),
+        "fields": list(grid.names),
+        "count": grid.size,
+    }
+    store = ColumnStore(dtypes, grid.size, meta)
+    try:
+        chunk = params.get("chunk_size", SWEEP_CHUNK)
+        starts = iter(range(0, grid.size, chunk))
+        pool = manager.pool()
+        window = 2 * manager.processes
+        pending, done_points = {}, 0
+        while True:
+            while len(pending) < window and not job.cancel_event.is_set():
+                start = next(starts, None)
+                if start is None:
+                    break
+                fut = pool.submit(
+                    _sweep_chunk, params["formula_id"], params["ranges"], params.get("fixed"), start, start + chunk
+                )
+                pending[fut] = start
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                start = pending.pop(fut)
+                cols = fut.result()
+                store.write(start, cols)
+                done_points += len(cols["valid"])
+            job.progress = done_points / grid.size if grid.size else 1.0
+            if job.cancel_event.is_set():
+                for fut in pending:
+                    fut.cancel()
+                wait(pending)
+                pending.clear()
+    except BaseException:
+        store.close()
+        raise
+    if job.cancel_event.is_set():
+        store.close()
+        return None
+    return store
+
+
+def _prepare_optimize(params: dict):
+    prepare_stages(params.get("stages") or (), params.get("min_gain", 1.0), params.get("max_stages"))
+    return params
+
+
+def _run_optimize(manager, job: Job, params):
+    def on_progress(report):
+        job.info = report
+        if report["tasks_total"]:
+            job.progress = report["tasks_done"] / report["tasks_total"]
+
+    result = optimize_chain(
+        params["stages"],
+        min_gain=params.get("min_gain", 1.0),
+        max_stages=params.get("max_stages"),
+        time_budget=params.get("time_budget"),
+        # Las tareas van al pool compartido: varias optimizaciones a la vez no multiplican los procesos
+        workers=min(params.get("workers") or manager.processes, manager.processes),
+        on_progress=on_progress,
+        cancel=job.cancel_event,
+        pool=manager.pool(),
+    )
+    return result.as_dict()
+
+
+def _prepare_montecarlo(params: dict):
+    monte_carlo_samplers(params["formula_id"], params["distributions"])
+    if params.get("samples", 1) < 1:
+        raise ValueError("El número de muestras debe ser positivo")
+    if not all(0 <= p <= 100 for p in params.get("percentiles", ())):
+        raise ValueError("Los percentiles deben estar entre 0 y 100")
+    return params
+
+
+def _run_montecarlo(manager, job: Job, params):
+    def on_progress(fraction):
+        job.progress = fraction
+
+    return monte_carlo(
+        **params,
+        on_progress=on_progress,
+        cancel=job.cancel_event,
+        pool=manager.pool(),
+        window=2 * manager.processes,
+    )
+
+
+# Cada tipo: (validación al enviar, ejecución en segundo plano)
+JOB_KINDS = {
+    "sweep": (_prepare_sweep, _run_sweep),
+    "optimize": (_prepare_optimize, _run_optimize),
+    "montecarlo": (_prepare_montecarlo, _run_montecarlo),
+}
+
+
+class JobManager:
+    """Cola acotada de trabajos con concurrencia limitada y un pool de procesos compartido."""
+
+    def __init__(self, max_concurrent: int = 2, max_queued: int = 16, processes: int = None, max_history: int = 64):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.processes = processes or max(1, (os.cpu_count() or 2) - 1)
+        self.max_history = max_history
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._runners = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="job")
+        self._pool = None
+        atexit.register(self.shutdown)
+
+    def pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.processes)
+            return self._pool
+
+    def submit(self, kind: str, params: dict) -> Job:
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Tipo de trabajo desconocido: '{kind}'")
+        prepare, _run = JOB_KINDS[kind]
+        prepared = prepare(params)
+        with self._lock:
+            if sum(job.active for job in self._jobs.values()) >= self.max_queued:
+                raise QueueFullError("Cola de trabajos llena")
+            job = Job(id=uuid.uuid4().hex, kind=kind, prepared=prepared)
+            self._jobs[job.id] = job
+            self._prune()
+        self._runners.submit(self._run, job)
+        return job
+
+    def _run(self, job: Job):
+        if job.cancel_event.is_set():
+            return
+        _prepare, run = JOB_KINDS[job.kind]
+        job.status = "running"
+        job.started = time.time()
+        try:
+            result = run(self, job, job.prepared)
+        except Exception as e:
+            job.error = str(e)
+            job.status = "error"
+        else:
+            if job.cancel_event.is_set():
+                job.status = "cancelled"
+                # La optimización devuelve lo mejor hallado antes de cancelarse
+                job.result = result if not isinstance(result, ColumnStore) else None
+            else:
+                job.result = result
+                job.progress = 1.0
+                job.status = "done"
+        job.finished = time.time()
+        job.prepared = None
+
+    def get(self, job_id: str) -> Job:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job
+
+    def cancel(self, job_id: str) -> Job:
+        """Cancela un trabajo activo; si ya había terminado lo elimina junto con su resultado."""
+        job = self.get(job_id)
+        if job.active:
+            job.cancel_event.set()
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished = time.time()
+        else:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            self._release(job)
+        return job
+
+    def _release(self, job: Job):
+        if isinstance(job.result, ColumnStore):
+            job.result.close()
+        job.result = None
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if not j.active]
+        for job in sorted(finished, key=lambda j: j.finished or 0)[: max(0, len(finished) - self.max_history)]:
+            del self._jobs[job.id]
+            self._release(job)
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "processes": self.processes,
+            **{s: statuses.count(s) for s in ("queued", "running", "done", "error", "cancelled")},
+        }
+
+    def shutdown(self):
+        for job in list(self._jobs.values()):
+            job.cancel_event.set()
+        self._runners.shutdown(wait=False, cancel_futures=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        for job in list(self._jobs.values()):
+            if not job.active:
+                self._release(job)